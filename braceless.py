@@ -20,9 +20,17 @@ import re
 import subprocess
 import tempfile
 import shutil
-from typing import List, Tuple, Optional, NamedTuple, Set, Dict, Callable
-from enum import Enum, auto
+import io
+import hashlib
+import threading
+from array import array
+from bisect import bisect_right
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import List, Tuple, Optional, NamedTuple, Set, Dict, Callable, TextIO, Iterator, Union
+from enum import Enum, IntEnum, auto
 from dataclasses import dataclass
+from collections.abc import Sequence
 import clang.cindex
 
 
@@ -39,6 +47,8 @@ class TokenKind(Enum):
 @dataclass
 class Token:
     """A single token from the source code"""
+    __slots__ = ('kind', 'spelling', 'line', 'column')
+    
     kind: TokenKind
     spelling: str
     line: int      # 1-based line number
@@ -116,9 +126,15 @@ def paren_balance(tokens: List[Token]) -> int:
     Positive = more opens than closes.
     Note: Does NOT count braces {} as they're typically block delimiters, not expression grouping.
     """
-    opens = sum(1 for t in tokens if t.kind == TokenKind.PUNCTUATION and t.spelling in '([')
-    closes = sum(1 for t in tokens if t.kind == TokenKind.PUNCTUATION and t.spelling in ')]')
-    return opens - closes
+    balance = 0
+    for t in tokens:
+        if t.kind == TokenKind.PUNCTUATION:
+            spelling = t.spelling
+            if spelling == '(' or spelling == '[':
+                balance += 1
+            elif spelling == ')' or spelling == ']':
+                balance -= 1
+    return balance
 
 
 def has_keyword(tokens: List[Token], keyword: str) -> bool:
@@ -177,6 +193,76 @@ def has_lambda_pattern(tokens: List[Token]) -> bool:
     return False
 
 
+def _control_keyword(m: List[Token]) -> Tuple[Optional[str], int]:
+    """
+    Detect a control keyword (if/for/while/switch/else if) at the start of a statement.
+    
+    Returns:
+        (keyword, index of the first token after the keyword), or (None, 0)
+    """
+    first = m[0]
+    if first.kind == TokenKind.KEYWORD:
+        if first.spelling in CONTROL_KEYWORDS:
+            return first.spelling, 1
+        if first.spelling == 'else' and len(m) > 1:
+            second = m[1]
+            if second.kind == TokenKind.KEYWORD and second.spelling == 'if':
+                return 'else if', 2
+    return None, 0
+
+
+def _condition_is_parenthesized(m: List[Token], start: int) -> bool:
+    """
+    Check if the condition m[start:-1] (before the trailing ':' or '{') is fully
+    wrapped in one pair of parentheses.
+    
+    The FIRST opening paren must match the LAST closing paren, which distinguishes
+    "if (a && b):" from "if (a) && (b):".
+    """
+    end = len(m) - 1
+    # Fast reject: must start with '(' and end with ')' right before the terminator
+    if start >= end or m[start].spelling != '(' or m[end - 1].spelling != ')':
+        return False
+    paren_depth = 0
+    for i in range(start, end):
+        spelling = m[i].spelling
+        if spelling == '(':
+            paren_depth += 1
+        elif spelling == ')':
+            paren_depth -= 1
+            if paren_depth == 0:
+                # The initial paren just closed - wrapped only if it is the last one
+                return i == end - 1
+    return False
+
+
+# String/char literals and // comments in raw source text
+_LITERAL_OR_COMMENT_RE = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//.*')
+
+
+def _mask_literal_or_comment(match) -> str:
+    text = match.group()
+    if text.startswith('//'):
+        return ' ' * len(text)
+    return text[0] + '_' * (len(text) - 2) + text[-1]
+
+
+def mask_literals_and_comments(text: str) -> str:
+    """
+    Mask out the parts of a raw source line that must not be scanned for syntax.
+    
+    String and character literal contents are replaced with '_' (keeping the quotes),
+    and // comments are replaced with spaces. Column positions are preserved, so
+    indices into the masked text are valid indices into the original.
+    """
+    return _LITERAL_OR_COMMENT_RE.sub(_mask_literal_or_comment, text)
+
+
+# Keyword spellings that are compared against on every logical line
+ACCESS_SPECIFIERS = frozenset(('public', 'private', 'protected'))
+CONTROL_KEYWORDS = frozenset(('if', 'for', 'while', 'switch'))
+
+
 class LogicalLine:
     """
     A logical line represents one or more physical lines that form a single statement.
@@ -192,6 +278,8 @@ class LogicalLine:
         self.raw_lines = raw_lines    # Original source lines (for whitespace preservation)
         self.tokens = tokens          # All tokens in this logical line
         self._meaningful = None       # Cached meaningful tokens
+        self._indent = None           # Cached visual indent
+        self._leading_ws = None       # Cached leading whitespace
     
     @property
     def meaningful(self) -> List[Token]:
@@ -200,17 +288,11 @@ class LogicalLine:
             self._meaningful = [t for t in self.tokens if t.kind != TokenKind.COMMENT]
         return self._meaningful
     
-    @property
-    def indent(self) -> int:
-        """
-        Get the visual indent level of this logical line.
-        Computed from the first token's column, converting tabs to 4 spaces.
-        """
-        if not self.raw_lines:
-            return 0
-        
-        first_line = self.raw_lines[0]
+    def _scan_leading_ws(self):
+        """Scan the first line's leading whitespace once, caching indent and leading_ws"""
+        first_line = self.raw_lines[0] if self.raw_lines else ''
         indent = 0
+        end = 0
         for ch in first_line:
             if ch == ' ':
                 indent += 1
@@ -218,15 +300,26 @@ class LogicalLine:
                 indent += 4
             else:
                 break
-        return indent
+            end += 1
+        self._indent = indent
+        self._leading_ws = first_line[:end]
+    
+    @property
+    def indent(self) -> int:
+        """
+        Get the visual indent level of this logical line.
+        Computed from the first token's column, converting tabs to 4 spaces.
+        """
+        if self._indent is None:
+            self._scan_leading_ws()
+        return self._indent
     
     @property
     def leading_ws(self) -> str:
         """Get the original leading whitespace from the first line"""
-        if not self.raw_lines:
-            return ''
-        first_line = self.raw_lines[0]
-        return first_line[:len(first_line) - len(first_line.lstrip(' \t'))]
+        if self._leading_ws is None:
+            self._scan_leading_ws()
+        return self._leading_ws
     
     def is_blank(self) -> bool:
         """Check if this is a blank line (no tokens)"""
@@ -266,7 +359,7 @@ class LogicalLine:
         # Check for case/default (these keep the colon)
         # case VALUE: or default:
         prev = m[-2]
-        if prev.kind == TokenKind.KEYWORD and prev.spelling in ('default',):
+        if prev.kind == TokenKind.KEYWORD and prev.spelling == 'default':
             return False
         if prev.kind == TokenKind.LITERAL:
             # Could be "case VALUE:" - check if 'case' appears before
@@ -276,7 +369,7 @@ class LogicalLine:
             return False
             
         # Check for access specifiers (public/private/protected:)
-        if len(m) == 2 and prev.kind == TokenKind.KEYWORD and prev.spelling in ('public', 'private', 'protected'):
+        if len(m) == 2 and prev.kind == TokenKind.KEYWORD and prev.spelling in ACCESS_SPECIFIERS:
             return False
         
         return True
@@ -287,7 +380,7 @@ class LogicalLine:
         if len(m) != 2:
             return False
         return (m[0].kind == TokenKind.KEYWORD and 
-                m[0].spelling in ('public', 'private', 'protected') and
+                m[0].spelling in ACCESS_SPECIFIERS and
                 m[1].spelling == ':')
     
     def is_case_or_default(self) -> bool:
@@ -321,9 +414,19 @@ CONTINUATION_OPS = {'+', '-', '*', '/', '%', '&', '|', '^', '=', '<', '>', ',',
 CONTINUATION_STARTERS = {'.', ',', ')', ']', '?', ':'}
 
 
-def _is_continuation_end(tokens: List[Token]) -> bool:
-    """Check if tokens end with a continuation operator or unmatched parens"""
-    m = meaningful_tokens(tokens)
+def _is_continuation_end(
+    tokens: List[Token],
+    balance: Optional[int] = None,
+    meaningful: Optional[List[Token]] = None
+) -> bool:
+    """Check if tokens end with a continuation operator or unmatched parens
+    
+    Args:
+        tokens: Tokens of the (possibly partial) logical line
+        balance: Precomputed paren_balance(tokens), if the caller already tracks it
+        meaningful: Precomputed meaningful_tokens(tokens), if the caller already tracks it
+    """
+    m = meaningful_tokens(tokens) if meaningful is None else meaningful
     if not m:
         return False
     
@@ -338,7 +441,9 @@ def _is_continuation_end(tokens: List[Token]) -> bool:
         return False
     
     # Unmatched parens/brackets/braces means continuation
-    if paren_balance(tokens) > 0:
+    if balance is None:
+        balance = paren_balance(tokens)
+    if balance > 0:
         return True
     
     # Continuation operators
@@ -415,6 +520,7 @@ def group_logical_lines(source: str, tokens: List[Token]) -> List[LogicalLine]:
         
         # Check if this line continues to the next
         cumulative_balance = paren_balance(all_tokens)
+        all_meaningful = meaningful_tokens(all_tokens)
         
         while i + 1 < len(lines):
             next_line_num = i + 2  # 1-based
@@ -428,7 +534,7 @@ def group_logical_lines(source: str, tokens: List[Token]) -> List[LogicalLine]:
             
             if cumulative_balance > 0:
                 should_continue = True
-            elif _is_continuation_end(all_tokens):
+            elif _is_continuation_end(all_tokens, cumulative_balance, all_meaningful):
                 should_continue = True
             elif _is_continuation_start(next_tokens):
                 should_continue = True
@@ -440,7 +546,9 @@ def group_logical_lines(source: str, tokens: List[Token]) -> List[LogicalLine]:
             i += 1
             raw_lines.append(lines[i])
             all_tokens.extend(next_tokens)
-            cumulative_balance = paren_balance(all_tokens)
+            # Balance and the comment-free tokens are additive, so only scan the newly merged line
+            cumulative_balance += paren_balance(next_tokens)
+            all_meaningful.extend(meaningful_tokens(next_tokens))
         
         logical_lines.append(LogicalLine(line_num, raw_lines, all_tokens))
         i += 1
@@ -448,45 +556,95 @@ def group_logical_lines(source: str, tokens: List[Token]) -> List[LogicalLine]:
     return logical_lines
 
 
-class BlockType(Enum):
-    NORMAL = auto()
-    CLASS = auto()
-    STRUCT = auto()
-    ENUM = auto()
-    UNION = auto()
-    SWITCH = auto()
-    LAMBDA = auto()
-    REGULAR_BRACE = auto()  # Regular C++ braces (don't output closing brace)
-    DO = auto()  # do-while loop (closing brace merges with while)
+class BlockType(IntEnum):
+    """Block kinds tracked on the block stack (IntEnum so comparisons are plain int compares)"""
+    NORMAL = 0
+    CLASS = 1
+    STRUCT = 2
+    ENUM = 3
+    UNION = 4
+    SWITCH = 5
+    LAMBDA = 6
+    REGULAR_BRACE = 7  # Regular C++ braces (don't output closing brace)
+    DO = 8  # do-while loop (closing brace merges with while)
+
+
+# Blocks whose closing brace needs a trailing semicolon
+SEMICOLON_BLOCK_TYPES = frozenset((BlockType.CLASS, BlockType.STRUCT, BlockType.ENUM,
+                                   BlockType.UNION, BlockType.LAMBDA))
+
+# Blocks that stay open across access specifiers
+CLASS_BLOCK_TYPES = frozenset((BlockType.CLASS, BlockType.STRUCT))
 
 
 class TrackedOutputList(list):
-    """A list that tracks source line mappings for each appended item"""
+    """A list that tracks source line mappings for each appended item.
+    
+    Appended items are attributed to current_source_line, which the compiler
+    sets when its source context changes, so append itself is the plain list
+    append. Adjacent output lines usually come from the same source line, so
+    the mapping is stored run-length encoded: run i starts at 0-based output
+    index _run_starts[i] and maps to source line _run_lines[i]. A run may be
+    empty if its start equals the next run's start.
+    """
     
-    def __init__(self, get_source_line_func):
+    def __init__(self, source_line: int = 1):
         super().__init__()
-        self._get_source_line = get_source_line_func
-        self.source_lines: List[int] = []
+        self._run_starts: List[int] = [0]
+        self._run_lines: List[int] = [source_line]
     
-    def append(self, item):
-        super().append(item)
-        self.source_lines.append(self._get_source_line())
+    @property
+    def current_source_line(self) -> int:
+        """Source line that newly appended items are attributed to"""
+        return self._run_lines[-1]
     
-    def extend(self, items):
-        for item in items:
-            self.append(item)
+    @current_source_line.setter
+    def current_source_line(self, source_line: int):
+        if self._run_lines[-1] == source_line:
+            return
+        if self._run_starts[-1] == len(self):
+            # Nothing was emitted for the current run; replace it
+            self._run_starts.pop()
+            self._run_lines.pop()
+            if self._run_lines and self._run_lines[-1] == source_line:
+                return
+        self._run_starts.append(len(self))
+        self._run_lines.append(source_line)
     
     def pop(self, index=-1):
         """Override pop to also remove the corresponding source line entry"""
+        if index < 0:
+            index += len(self)
         result = super().pop(index)
-        self.source_lines.pop(index)
+        starts = self._run_starts
+        for i in range(bisect_right(starts, index), len(starts)):
+            starts[i] -= 1
         return result
     
+    def _iter_runs(self):
+        """Yield (start, end, source_line) for each non-empty run"""
+        ends = self._run_starts[1:] + [len(self)]
+        for start, end, source_line in zip(self._run_starts, ends, self._run_lines):
+            if end > start:
+                yield start, end, source_line
+    
+    @property
+    def source_lines(self) -> List[int]:
+        """Flat list of source lines, one per output line"""
+        result = []
+        for start, end, source_line in self._iter_runs():
+            result.extend([source_line] * (end - start))
+        return result
+    
+    def source_runs(self) -> List[Tuple[int, int]]:
+        """Return (line_count, source_line) for each run of output lines"""
+        return [(end - start, source_line) for start, end, source_line in self._iter_runs()]
+    
     def get_source_line(self, output_line: int) -> int:
         """Get the source line for a given output line (1-based)"""
         idx = output_line - 1
-        if 0 <= idx < len(self.source_lines):
-            return self.source_lines[idx]
+        if 0 <= idx < len(self):
+            return self._run_lines[bisect_right(self._run_starts, idx) - 1]
         return output_line
 
 
@@ -498,10 +656,15 @@ class Compiler:
     eliminating the need for complex multiline state tracking.
     """
     
-    def __init__(self, lines: List[str]):
-        # Join lines into source, preserving original lines for whitespace
-        self.source = '\n'.join(line.rstrip('\n\r') for line in lines)
-        self.lines = [line.rstrip('\n\r') for line in lines]
+    def __init__(self, lines: Union[str, List[str]]):
+        # Join lines into source, preserving original lines for whitespace. A
+        # whole text (as expand_blh_includes returns) is used as the source directly.
+        if isinstance(lines, str):
+            self.source = lines[:-1] if lines.endswith('\n') else lines
+            self.lines = self.source.split('\n') if lines else []
+        else:
+            self.lines = [line.rstrip('\n\r') for line in lines]
+            self.source = '\n'.join(self.lines)
         
         # Tokenize the entire source
         self.tokens = tokenize(self.source)
@@ -509,15 +672,18 @@ class Compiler:
         # Group into logical lines
         self.logical_lines = group_logical_lines(self.source, self.tokens)
         
+        # For each logical line, the next logical line containing code (for block lookahead)
+        self._next_code_line = self._build_next_code_lines(self.logical_lines)
+        
         # State tracking
         self.indent_stack = [0]
         self.block_type_stack = [BlockType.NORMAL]
         self.whitespace_stack = ['']  # Track whitespace for closing braces
         
         # Output with line tracking
-        self._source_line_context = 1
-        self.output = TrackedOutputList(lambda: self._source_line_context)
+        self.output = TrackedOutputList(source_line=1)
         self._current_ll = None
+        self._current_index = 0
         
         # Pending blank lines (for proper placement around closing braces)
         self.pending_blank_lines = []
@@ -525,12 +691,43 @@ class Compiler:
         # Flag for do-while handling
         self._do_while_handled = False
     
+    @property
+    def _source_line_context(self) -> int:
+        """Source line that output lines emitted now are attributed to"""
+        return self.output.current_source_line
+    
+    @_source_line_context.setter
+    def _source_line_context(self, source_line: int):
+        self.output.current_source_line = source_line
+    
     def compile(self) -> str:
         """Compile the braceless C++ to regular C++, tracking line mappings"""
-        for ll in self.logical_lines:
+        self._compile_lines()
+        return '\n'.join(self.output) + '\n'
+    
+    def compile_to(self, stream: TextIO):
+        """Compile and write the result to a text stream.
+        
+        Produces the same text as compile(), but writes it line by line instead of
+        building the joined output string in memory first.
+        
+        Args:
+            stream: Writable text stream (e.g. an open file or sys.stdout)
+        """
+        self._compile_lines()
+        if not self.output:
+            # compile() still ends its (empty) text with a newline
+            stream.write('\n')
+            return
+        stream.writelines(line + '\n' for line in self.output)
+    
+    def _compile_lines(self):
+        """Process all logical lines into self.output"""
+        for index, ll in enumerate(self.logical_lines):
             # Set context to the start line of this logical line
             self._source_line_context = ll.start_line
             self._current_ll = ll
+            self._current_index = index
             self._process_logical_line(ll)
         
         # Close any remaining blocks - use last line as context
@@ -552,8 +749,20 @@ class Compiler:
                 self.output.append(raw)
             else:
                 self.output.append(item)
+    
+    @staticmethod
+    def _build_next_code_lines(logical_lines: List[LogicalLine]) -> List[Optional[LogicalLine]]:
+        """For each logical line, find the next logical line that is not blank or comment-only.
         
-        return '\n'.join(self.output) + '\n'
+        Computed in a single backward pass so block lookahead is O(1) per block.
+        """
+        next_code = [None] * len(logical_lines)
+        following = None
+        for i in range(len(logical_lines) - 1, -1, -1):
+            next_code[i] = following
+            if not logical_lines[i].is_blank_or_comment():
+                following = logical_lines[i]
+        return next_code
     
     def _buffer_blank_or_comment(self, raw_line: str, indent: int, source_line: int):
         """Buffer a blank or comment line. Can be overridden for line tracking.
@@ -595,7 +804,7 @@ class Compiler:
                         inside_blanks.append((raw, src_line))
                     else:
                         after_blanks.append((raw, src_line))
-                self.pending_blank_lines = []
+                self.pending_blank_lines.clear()
                 
                 # Output inside blanks first
                 self._emit_buffered_lines(inside_blanks)
@@ -617,7 +826,7 @@ class Compiler:
                         inside_blanks.append((raw, src_line))
                     else:
                         after_blanks.append((raw, src_line))
-                self.pending_blank_lines = []
+                self.pending_blank_lines.clear()
                 
                 # Output inside blanks before closing brace
                 self._emit_buffered_lines(inside_blanks)
@@ -722,7 +931,7 @@ class Compiler:
     def _close_to_class_level(self):
         """Close inner blocks but keep class/struct open (for access specifiers)"""
         while len(self.indent_stack) > 1:
-            if self.block_type_stack[-1] in (BlockType.CLASS, BlockType.STRUCT):
+            if self.block_type_stack[-1] in CLASS_BLOCK_TYPES:
                 break
             self.indent_stack.pop()
             block_type = self.block_type_stack.pop() if len(self.block_type_stack) > 1 else BlockType.NORMAL
@@ -768,48 +977,16 @@ class Compiler:
             return ll.leading_ws
         
         # Check if first token is a control keyword
-        first = m[0]
-        control_keywords = {'if', 'for', 'while', 'switch'}
-        
-        keyword = None
-        keyword_end_idx = 0
-        
-        if first.kind == TokenKind.KEYWORD:
-            if first.spelling in control_keywords:
-                keyword = first.spelling
-                keyword_end_idx = 1
-            elif first.spelling == 'else' and len(m) > 1:
-                second = m[1]
-                if second.kind == TokenKind.KEYWORD and second.spelling == 'if':
-                    keyword = 'else if'
-                    keyword_end_idx = 2
+        keyword, keyword_end_idx = _control_keyword(m)
         
         if not keyword:
             # Not a control structure - use original line without colon
             return self._strip_trailing_colon(ll)
         
         # Check if condition is already fully wrapped in parentheses
-        if keyword_end_idx < len(m) and m[keyword_end_idx].spelling == '(':
-            # Check if the FIRST opening paren matches the LAST closing paren (right before ':')
-            # This distinguishes "if (a && b):" from "if (a) && b:"
-            # We track when the initial paren is closed, not just any paren reaching 0
-            paren_depth = 0
-            first_paren_closes_at_end = False
-            for i in range(keyword_end_idx, len(m) - 1):  # -1 to exclude ':'
-                if m[i].spelling == '(':
-                    paren_depth += 1
-                elif m[i].spelling == ')':
-                    paren_depth -= 1
-                    if paren_depth == 0:
-                        # The initial paren just closed
-                        if i == len(m) - 2:
-                            # And it closes right before :, so fully wrapped
-                            first_paren_closes_at_end = True
-                        # Either way, break here since the initial paren is now closed
-                        break
-            if first_paren_closes_at_end:
-                # Already has parens around entire condition - just strip the colon
-                return self._strip_trailing_colon(ll)
+        if _condition_is_parenthesized(m, keyword_end_idx):
+            # Already has parens around entire condition - just strip the colon
+            return self._strip_trailing_colon(ll)
         
         # Need to wrap the condition in parentheses
         colon_token = m[-1]  # Should be ':'
@@ -908,47 +1085,24 @@ class Compiler:
                 lines[colon_line] = before_colon.rstrip() + after_colon
             return '\n'.join(lines)
     
-    def _wrap_condition_for_brace(self, ll: LogicalLine) -> Optional[str]:
+    def _wrap_condition_for_brace(self, ll: LogicalLine) -> Optional[List[str]]:
         """
         Wrap condition in parentheses for control structures ending with {.
-        Returns the transformed line if wrapping was needed, None otherwise.
+        Returns the transformed lines if wrapping was needed, None otherwise.
         """
         m = ll.meaningful
         if not m or m[-1].spelling != '{':
             return None
         
         # Check if first token is a control keyword
-        first = m[0]
-        control_keywords = {'if', 'for', 'while', 'switch'}
-        
-        keyword = None
-        keyword_end_idx = 0
-        
-        if first.kind == TokenKind.KEYWORD:
-            if first.spelling in control_keywords:
-                keyword = first.spelling
-                keyword_end_idx = 1
-            elif first.spelling == 'else' and len(m) > 1:
-                second = m[1]
-                if second.kind == TokenKind.KEYWORD and second.spelling == 'if':
-                    keyword = 'else if'
-                    keyword_end_idx = 2
+        keyword, keyword_end_idx = _control_keyword(m)
         
         if not keyword:
             return None
         
         # Check if condition is already wrapped in parentheses
-        if keyword_end_idx < len(m) - 1 and m[keyword_end_idx].spelling == '(':
-            # Check if the opening paren matches a closing paren right before '{'
-            paren_depth = 0
-            for i in range(keyword_end_idx, len(m) - 1):  # -1 to exclude '{'
-                if m[i].spelling == '(':
-                    paren_depth += 1
-                elif m[i].spelling == ')':
-                    paren_depth -= 1
-                    if paren_depth == 0 and i == len(m) - 2:
-                        # Already fully wrapped
-                        return None
+        if _condition_is_parenthesized(m, keyword_end_idx):
+            return None
         
         # Need to wrap the condition in parentheses
         raw_line = ll.raw_lines[0] if ll.raw_lines else ''
@@ -959,6 +1113,16 @@ class Compiler:
         
         brace_token = m[-1]
         brace_col = brace_token.column - 1  # 0-based
+        brace_line_idx = brace_token.line - ll.start_line  # 0-based index into raw_lines
+        
+        if brace_line_idx > 0:
+            # Multiline condition - open the paren after the keyword on the first
+            # line and close it before the brace, keeping the lines in between
+            lines = list(ll.raw_lines)
+            lines[0] = f"{ll.leading_ws}{keyword} ({raw_line[keyword_end_col:].lstrip()}"
+            brace_line = lines[brace_line_idx]
+            lines[brace_line_idx] = f"{brace_line[:brace_col].rstrip()}) {{{brace_line[brace_col + 1:]}"
+            return lines
         
         # Extract condition from source (between keyword and brace)
         condition = raw_line[keyword_end_col:brace_col].strip()
@@ -976,7 +1140,7 @@ class Compiler:
             result += ' ' + comment_text
         elif after_brace.strip():
             result += after_brace
-        return result
+        return [result]
     
     def _handle_block_start(self, ll: LogicalLine):
         """Handle a line that starts a braceless block (ends with :)"""
@@ -1042,12 +1206,8 @@ class Compiler:
                 self.output.append(f"{ll.leading_ws}{raw_content}")
         else:
             # Check if this is a control statement that needs parens around condition
-            wrapped_line = self._wrap_condition_for_brace(ll)
-            if wrapped_line is not None:
-                self.output.append(wrapped_line)
-            else:
-                # Output lines as-is
-                self._emit_raw_lines(ll)
+            # Output the lines as-is unless the condition needs parens
+            self._emit_raw_lines(ll, self._wrap_condition_for_brace(ll))
         
         # Track the regular brace block
         self._push_block(ll, BlockType.REGULAR_BRACE)
@@ -1079,18 +1239,19 @@ class Compiler:
         
         while i < len(lines):
             line = lines[i]
-            stripped = line.rstrip()
+            # Scan a masked copy so brackets/colons in strings and comments don't count
+            code = mask_literals_and_comments(line).rstrip()
             
             # Check if line ends with ): or ]: (lambda pattern with colon)
             # Make sure there's a [ somewhere before the : to confirm it's a lambda
-            if stripped.endswith(':') and '[' in stripped:
+            if code.endswith(':') and '[' in code:
                 # Check if this looks like a lambda: [...] or [...](...)
                 # Find the last ] before the :
-                colon_pos = len(stripped) - 1
-                bracket_pos = stripped.rfind(']')
+                colon_pos = len(code) - 1
+                bracket_pos = code.rfind(']')
                 
                 if bracket_pos >= 0:
-                    between = stripped[bracket_pos + 1:colon_pos].strip()
+                    between = code[bracket_pos + 1:colon_pos].strip()
                     # Valid lambda patterns: ] followed by : or ](...) followed by :
                     if between == '' or (between.startswith('(') and between.endswith(')')):
                         # This is a braceless lambda
@@ -1120,18 +1281,20 @@ class Compiler:
                                 
                                 if body_end > body_start:
                                     # Transform the lambda
-                                    # 1. Replace trailing : with {
-                                    new_lambda_line = stripped[:-1] + ' {'
+                                    # 1. Replace trailing : with { (keeping any trailing comment)
+                                    new_lambda_line = line[:colon_pos] + ' {' + line[colon_pos + 1:].rstrip()
                                     result.append(line[:lambda_indent] + new_lambda_line.lstrip())
                                     
                                     # 2. Process body lines (add semicolons if needed)
                                     for j in range(body_start, body_end):
                                         body_line = lines[j]
-                                        body_stripped = body_line.rstrip()
-                                        if body_stripped and not body_stripped.endswith((';', '{', '}', ':')):
+                                        body_code = mask_literals_and_comments(body_line).rstrip()
+                                        if body_code and not body_code.endswith((';', '{', '}', ':')):
                                             # Check if it's not a continuation
-                                            if not body_stripped.startswith((',', ')', ']')):
-                                                body_line = body_stripped + ';'
+                                            if not body_code.startswith((',', ')', ']')):
+                                                # Semicolon goes after the code, before any comment
+                                                code_end = len(body_code)
+                                                body_line = body_line[:code_end] + ';' + body_line[code_end:].rstrip()
                                                 body_indent = len(lines[j]) - len(lines[j].lstrip())
                                                 result.append(' ' * body_indent + body_line.lstrip())
                                             else:
@@ -1257,15 +1420,12 @@ class Compiler:
         # For now, just use current indent + 4 as placeholder
         # The actual content indent will be determined when we see the next line
         
-        # Find the next non-blank logical line to get its indent
-        ll_idx = self.logical_lines.index(ll)
+        # Use the next non-blank logical line to get its indent
         content_indent = ll.indent + 4  # Default
         
-        for next_ll in self.logical_lines[ll_idx + 1:]:
-            if not next_ll.is_blank_or_comment():
-                if next_ll.indent > ll.indent:
-                    content_indent = next_ll.indent
-                break
+        next_ll = self._next_code_line[self._current_index]
+        if next_ll is not None and next_ll.indent > ll.indent:
+            content_indent = next_ll.indent
         
         self.indent_stack.append(content_indent)
         self.block_type_stack.append(block_type)
@@ -1273,7 +1433,7 @@ class Compiler:
     
     def _output_closing_brace(self, block_type: BlockType, closing_ws: str = ""):
         """Output a closing brace with optional semicolon"""
-        needs_semi = block_type in (BlockType.CLASS, BlockType.STRUCT, BlockType.ENUM, BlockType.UNION, BlockType.LAMBDA)
+        needs_semi = block_type in SEMICOLON_BLOCK_TYPES
         
         closing = f"{closing_ws}}}"
         if needs_semi:
@@ -1294,7 +1454,7 @@ class Compiler:
                 else:
                     buffered.append((item, 0))
             self._emit_buffered_lines(buffered)
-            self.pending_blank_lines = []
+            self.pending_blank_lines.clear()
     
     def _emit_buffered_lines(self, buffered: List[Tuple[str, int]]):
         """Emit buffered lines with proper source line tracking.
@@ -1365,99 +1525,359 @@ def is_blh_file(filepath: str) -> bool:
 
 
 # Pattern to match #include "*.blh" directives
-BLH_INCLUDE_PATTERN = re.compile(r'^(\s*)#\s*include\s*"([^"]*\.blh)"', re.IGNORECASE)
-
-
-def resolve_include(filename: str, search_dirs: List[str]) -> Optional[str]:
+# Matched against a whole file with MULTILINE, so whitespace must not span lines
+BLH_INCLUDE_PATTERN = re.compile(r'^([^\S\n]*)#[^\S\n]*include[^\S\n]*"([^"\n]*\.blh)"',
+                                 re.IGNORECASE | re.MULTILINE)
+
+
+class IncludeCache:
+    """Header expansions and lookups shared between expand_blh_includes calls.
+    
+    Nothing in it is invalidated, so it is only valid while the files it
+    describes stay unchanged: each expand_blh_includes call gets a fresh one
+    unless the caller passes one in, as the compiler wrapper does to share
+    headers between the translation units of one compiler run.
+    
+    expansions is keyed by (header_path, include_dirs). Each entry holds the
+    header's expansion as if nothing had been included before it, plus every
+    header it pulled in: (text, line_count, source_runs, closure). Source runs
+    are (offset, file, first_line), relative to the header's first expanded line.
+    listings maps a directory to its .blh entries, keyed by lowercase name;
+    probes, searches and real_paths hold the results of _probe_include,
+    _search_include_dirs and _real_path by their arguments.
+    """
+    __slots__ = ('expansions', 'listings', 'probes', 'searches', 'real_paths')
+    
+    def __init__(self):
+        self.expansions: Dict[Tuple[str, Tuple[str, ...]], Tuple[str, int, List[Tuple[int, str, int]], frozenset]] = {}
+        self.listings: Dict[str, Dict[str, str]] = {}
+        self.probes: Dict[Tuple[str, str], Optional[str]] = {}
+        self.searches: Dict[Tuple[str, Tuple[str, ...]], Optional[str]] = {}
+        self.real_paths: Dict[str, str] = {}
+
+
+def _list_include_dir(dir_path: str, cache: IncludeCache) -> Dict[str, str]:
+    """List the .blh entries of a directory once per cache, keyed by lowercase name"""
+    listing = cache.listings.get(dir_path)
+    if listing is None:
+        try:
+            with os.scandir(dir_path or '.') as entries:
+                listing = {entry.name.lower(): entry.name for entry in entries
+                           if entry.name.lower().endswith('.blh')}
+        except OSError:
+            listing = {}
+        cache.listings[dir_path] = listing
+    return listing
+
+
+def _probe_include(dir_path: str, filename: str, cache: IncludeCache) -> Optional[str]:
+    """Return the absolute path of dir_path/filename if it exists, None otherwise"""
+    key = (dir_path, filename)
+    if key in cache.probes:
+        return cache.probes[key]
+    resolved = cache.probes[key] = _probe_include_uncached(dir_path, filename, cache)
+    return resolved
+
+
+def _probe_include_uncached(dir_path: str, filename: str, cache: IncludeCache) -> Optional[str]:
+    full_path = os.path.join(dir_path, filename)
+    if os.sep in filename or (os.altsep and os.altsep in filename):
+        # Not a plain name, so the directory listing can't answer it
+        if os.path.exists(full_path):
+            return os.path.abspath(full_path)
+        return None
+    
+    # Answer from the directory listing; a name that only matches ignoring
+    # case is left to the filesystem to decide
+    entry_name = _list_include_dir(dir_path, cache).get(filename.lower())
+    if entry_name is None:
+        return None
+    if entry_name != filename and not os.path.exists(full_path):
+        return None
+    return os.path.abspath(full_path)
+
+
+def resolve_include(
+    filename: str,
+    search_dirs: List[str],
+    origin_dir: Optional[str] = None,
+    cache: Optional[IncludeCache] = None
+) -> Optional[str]:
     """Find a header file in search directories.
     
     Args:
         filename: The filename from the #include directive
         search_dirs: List of directories to search
+        origin_dir: Directory of the including file, searched before search_dirs
+        cache: Directory listings to reuse and extend; a fresh IncludeCache if None
         
     Returns:
         Absolute path to the file if found, None otherwise
     """
+    if cache is None:
+        cache = IncludeCache()
+    # Headers usually sit next to the file including them, so try that first;
+    # the search_dirs result does not depend on the includer and is shared
+    if origin_dir is not None:
+        resolved = _probe_include(origin_dir, filename, cache)
+        if resolved is not None:
+            return resolved
+    return _search_include_dirs(filename, tuple(search_dirs), cache)
+
+
+def _search_include_dirs(filename: str, search_dirs: Tuple[str, ...], cache: IncludeCache) -> Optional[str]:
+    """Return the absolute path of the first search_dirs/filename that exists"""
+    key = (filename, search_dirs)
+    if key in cache.searches:
+        return cache.searches[key]
+    resolved = None
     for dir_path in search_dirs:
-        full_path = os.path.join(dir_path, filename)
-        if os.path.exists(full_path):
-            return os.path.abspath(full_path)
-    return None
+        resolved = _probe_include(dir_path, filename, cache)
+        if resolved is not None:
+            break
+    cache.searches[key] = resolved
+    return resolved
+
+
+def _real_path(path: str, cache: IncludeCache) -> str:
+    """os.path.realpath, once per cache; identifies a header for #pragma once handling"""
+    real_path = cache.real_paths.get(path)
+    if real_path is None:
+        real_path = cache.real_paths[path] = os.path.realpath(path)
+    return real_path
+
+
+@dataclass
+class _IncludeFrame:
+    """A file being expanded by expand_blh_includes"""
+    path: str
+    text: str
+    matches: Iterator
+    origin_dir: str
+    out_start: int                    # Index of this file's first expanded line
+    piece_start: int = 0              # Index of this file's first piece of expanded text
+    cache_key: Optional[Tuple] = None  # None for the top-level source file
+    start_seq: int = 0                # Include sequence number of this header
+    min_skipped_seq: int = sys.maxsize  # Oldest already-included header skipped in this subtree
+    pos: int = 0
+    line_num: int = 1
+
+
+class SourceRuns:
+    """Original source locations of expanded lines, run-length encoded.
+    
+    A run is a stretch of expanded lines taken from consecutive lines of one
+    file, so a file only adds a run per include it contains. Run k starts at
+    expanded index starts[k] with line first_lines[k] of files[file_ids[k]].
+    """
+    __slots__ = ('starts', 'file_ids', 'first_lines', 'files', '_file_ids_by_path')
+    
+    def __init__(self):
+        self.starts = array('i')
+        self.file_ids = array('I')
+        self.first_lines = array('i')
+        self.files: List[str] = []
+        self._file_ids_by_path: Dict[str, int] = {}
+    
+    def add(self, start: int, file: str, first_line: int):
+        """Note that expanded lines from index start on come from file, at first_line"""
+        file_id = self._file_ids_by_path.get(file)
+        if file_id is None:
+            file_id = self._file_ids_by_path[file] = len(self.files)
+            self.files.append(file)
+        if self.starts:
+            last_start = self.starts[-1]
+            if self.file_ids[-1] == file_id and self.first_lines[-1] + (start - last_start) == first_line:
+                return  # Continues the last run
+            if last_start == start:
+                # The last run turned out empty
+                self.file_ids[-1] = file_id
+                self.first_lines[-1] = first_line
+                return
+        self.starts.append(start)
+        self.file_ids.append(file_id)
+        self.first_lines.append(first_line)
+    
+    def runs_between(self, start: int, end: int) -> List[Tuple[int, str, int]]:
+        """The runs covering expanded indices start..end-1, as (offset from start, file, first_line)"""
+        if start >= end or not self.starts:
+            return []
+        k = bisect_right(self.starts, start) - 1
+        runs = [(0, self.files[self.file_ids[k]], self.first_lines[k] + start - self.starts[k])]
+        for k in range(k + 1, bisect_right(self.starts, end - 1)):
+            runs.append((self.starts[k] - start, self.files[self.file_ids[k]], self.first_lines[k]))
+        return runs
+    
+    def locate(self, index: int) -> Tuple[str, int]:
+        """(file, line) of the expanded line at 0-based index"""
+        k = bisect_right(self.starts, index) - 1
+        return self.files[self.file_ids[k]], self.first_lines[k] + index - self.starts[k]
+
+
+class _ParsedSource(NamedTuple):
+    """A source file's text and its #include "*.blh" matches, in order"""
+    text: str
+    includes: Tuple[re.Match, ...]
+
+
+@lru_cache(maxsize=512)
+def _parse_source(path: str, mtime_ns: int, size: int) -> _ParsedSource:
+    """Read and scan a file; keyed on mtime and size so an edited file is read again"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    # One bulk decode instead of a text-mode reader; translate newlines the way it
+    # would, but only for files that have any carriage returns
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return _ParsedSource(text, tuple(BLH_INCLUDE_PATTERN.finditer(text)))
+
+
+def _open_include_frame(path: str, include_dirs: Optional[List[str]], out_start: int) -> _IncludeFrame:
+    """Read a file (or reuse an earlier read of it) and set up its include scan"""
+    try:
+        st = os.stat(path)
+        parsed = _parse_source(path, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Cannot open source file: {path}")
+    # Every expanded line refers to its file's path, so share one string per path
+    path = sys.intern(path)
+    return _IncludeFrame(path, parsed.text, iter(parsed.includes), os.path.dirname(path), out_start)
 
 
 def expand_blh_includes(
     source_path: str,
     include_dirs: List[str] = None,
-    included_files: Set[str] = None
-) -> Tuple[List[str], Dict[int, Tuple[str, int]]]:
+    included_files: Set[str] = None,
+    cache: Optional[IncludeCache] = None
+) -> Tuple[str, SourceRuns]:
     """Expand all #include "*.blh" directives recursively.
     
     This function reads a source file and inlines any .blh headers it includes,
-    tracking the original source location of each line.
+    tracking the original source location of each line. Nested includes are
+    walked with an explicit stack, so deep header chains don't recurse. The
+    expansion is built from whole slices of each file's text rather than from
+    individual lines.
     
     Args:
         source_path: Path to the source file to process
         include_dirs: Additional directories to search for headers
-        included_files: Set of already-included files (for #pragma once handling)
+        included_files: Real paths of already-included files (for #pragma once handling)
+        cache: Header expansions to reuse and extend; a fresh IncludeCache if None
         
     Returns:
         Tuple of:
-        - lines: List of lines with .blh content inlined
-        - line_map: Dict mapping output_line_num -> (original_file, original_line_num)
+        - text: The source with .blh content inlined; every line ends with a newline
+        - source_runs: Original file and 1-based line of each line, run-length encoded
     """
     if included_files is None:
         included_files = set()
-    
-    source_path = os.path.abspath(source_path)
-    source_dir = os.path.dirname(source_path)
-    search_dirs = [source_dir] + (include_dirs or [])
-    
-    lines = []
-    line_map = {}
-    
-    try:
-        with open(source_path, 'r', encoding='utf-8') as f:
-            source_lines = f.readlines()
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Cannot open source file: {source_path}")
-    
-    for src_line_num, line in enumerate(source_lines, 1):
-        match = BLH_INCLUDE_PATTERN.match(line)
+    if cache is None:
+        cache = IncludeCache()
+    expansions = cache.expansions
+    
+    pieces = []
+    line_count = 0
+    source_runs = SourceRuns()
+    
+    # Headers included during this call, in order; their index is their sequence number.
+    # Headers that were already in included_files count as older than all of them.
+    include_order = []
+    include_seq = {}
+    dirs_key = tuple(include_dirs or ())
+    
+    def add_text(frame: _IncludeFrame, text: str, src_line_num: int):
+        """Add whole lines of a file, starting at line src_line_num"""
+        nonlocal line_count
+        if not text:
+            return
+        count = text.count('\n')
+        pieces.append(text)
+        if not text.endswith('\n'):
+            # The file's last line has no newline of its own
+            pieces.append('\n')
+            count += 1
+        source_runs.add(line_count, frame.path, src_line_num)
+        line_count += count
+    
+    def add_region(frame: _IncludeFrame, region: str):
+        """Add the lines of a region with no includes"""
+        start = line_count
+        add_text(frame, region, frame.line_num)
+        frame.line_num += line_count - start
+    
+    def mark_included(path: str):
+        included_files.add(path)
+        include_seq[path] = len(include_order)
+        include_order.append(path)
+    
+    stack = [_open_include_frame(os.path.abspath(source_path), include_dirs, 0)]
+    while stack:
+        frame = stack[-1]
+        match = next(frame.matches, None)
+        
+        if match is None:
+            # Regular lines after the last include, then this file is done
+            add_region(frame, frame.text[frame.pos:])
+            stack.pop()
+            # The expansion can be reused elsewhere unless #pragma once skipped a
+            # header that was included before this one started
+            if frame.cache_key is not None and frame.min_skipped_seq >= frame.start_seq:
+                start = frame.out_start
+                expansions[frame.cache_key] = (
+                    ''.join(pieces[frame.piece_start:]), line_count - start,
+                    source_runs.runs_between(start, line_count),
+                    frozenset(include_order[frame.start_seq:]))
+            if stack:
+                stack[-1].min_skipped_seq = min(stack[-1].min_skipped_seq, frame.min_skipped_seq)
+            continue
         
-        if match:
-            indent = match.group(1)
-            blh_name = match.group(2)
-            blh_path = resolve_include(blh_name, search_dirs)
-            
-            if blh_path is None:
-                # Header not found - keep the include line as-is
-                # The C++ compiler will report the error
-                output_line = len(lines) + 1
-                lines.append(line)
-                line_map[output_line] = (source_path, src_line_num)
-            elif blh_path in included_files:
-                # Already included (handles #pragma once semantics)
-                # Skip this include entirely
-                pass
+        # Scan the whole file once; only include lines are handled individually
+        add_region(frame, frame.text[frame.pos:match.start()])
+        line_end = frame.text.find('\n', match.end())
+        frame.pos = len(frame.text) if line_end < 0 else line_end + 1
+        line = frame.text[match.start():frame.pos]
+        src_line_num = frame.line_num
+        frame.line_num += 1
+        
+        blh_name = match.group(2)
+        blh_path = resolve_include(blh_name, dirs_key, frame.origin_dir, cache)
+        
+        if blh_path is None:
+            # Header not found - keep the include line as-is
+            # The C++ compiler will report the error
+            add_text(frame, line, src_line_num)
+            continue
+        
+        # Identify headers by real path, so one reached through a symlink or a
+        # different relative path is still only included once
+        blh_real_path = _real_path(blh_path, cache)
+        if blh_real_path in included_files:
+            # Already included (handles #pragma once semantics)
+            # Skip this include entirely
+            frame.min_skipped_seq = min(frame.min_skipped_seq, include_seq.get(blh_real_path, -1))
+        else:
+            cache_key = (blh_path, dirs_key)
+            cached = expansions.get(cache_key)
+            if cached is not None and included_files.isdisjoint(cached[3]):
+                # Reuse the cached expansion along with its source locations
+                sub_text, sub_line_count, sub_runs, closure = cached
+                for path in closure:
+                    mark_included(path)
+                for offset, path, first_line in sub_runs:
+                    source_runs.add(line_count + offset, path, first_line)
+                pieces.append(sub_text)
+                line_count += sub_line_count
             else:
                 # Expand the header
-                included_files.add(blh_path)
-                sub_lines, sub_map = expand_blh_includes(blh_path, include_dirs, included_files)
-                
-                # Add all lines from the included file
-                base_output_line = len(lines)
-                for i, sub_line in enumerate(sub_lines):
-                    output_line = base_output_line + i + 1
-                    lines.append(sub_line)
-                    # Copy the source location from the sub-expansion
-                    line_map[output_line] = sub_map[i + 1]
-        else:
-            # Regular line - add it with its source location
-            output_line = len(lines) + 1
-            lines.append(line)
-            line_map[output_line] = (source_path, src_line_num)
+                mark_included(blh_real_path)
+                child = _open_include_frame(blh_path, include_dirs, line_count)
+                child.piece_start = len(pieces)
+                child.cache_key = cache_key
+                child.start_seq = include_seq[blh_real_path]
+                stack.append(child)
     
-    return lines, line_map
+    return ''.join(pieces), source_runs
 
 
 def extract_include_dirs(args: List[str]) -> List[str]:
@@ -1487,11 +1907,53 @@ def extract_include_dirs(args: List[str]) -> List[str]:
     return include_dirs
 
 
-# SourceMapping: List where index i contains (original_file, original_line) for output line i+1
-SourceMapping = List[Tuple[str, int]]
-
-
-def transpile_file(source_path: str, output_path: str, include_dirs: List[str] = None) -> SourceMapping:
+class SourceMapping(Sequence):
+    """Maps transpiled output lines back to original source locations.
+    
+    Index i holds (original_file, original_line) for output line i+1. The
+    mapping is only needed to rewrite compiler diagnostics, so nothing is
+    resolved up front: it keeps the compiler's run-length encoded output
+    line runs plus the .blh expansion's source runs, and each lookup is a
+    binary search over both.
+    """
+    
+    def __init__(self, runs: List[Tuple[int, int]], source_runs: SourceRuns, expanded_count: int):
+        """
+        Args:
+            runs: (line_count, expanded_line) for each run of output lines
+            source_runs: Original locations of the expanded lines
+            expanded_count: Number of expanded lines
+        """
+        self._run_ends: List[int] = []
+        self._run_lines: List[int] = []
+        end = 0
+        for line_count, expanded_line in runs:
+            end += line_count
+            self._run_ends.append(end)
+            self._run_lines.append(expanded_line)
+        self._source_runs = source_runs
+        self._expanded_count = expanded_count
+    
+    def __len__(self) -> int:
+        return self._run_ends[-1] if self._run_ends else 0
+    
+    def __getitem__(self, idx: int) -> Tuple[str, int]:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("SourceMapping index out of range")
+        expanded_line = self._run_lines[bisect_right(self._run_ends, idx)]
+        if 0 < expanded_line <= self._expanded_count:
+            return self._source_runs.locate(expanded_line - 1)
+        return ("<unknown>", expanded_line)
+
+
+def transpile_file(
+    source_path: str,
+    output_path: str,
+    include_dirs: List[str] = None,
+    cache: Optional[IncludeCache] = None
+) -> SourceMapping:
     """Transpile a braceless C++ file to regular C++.
     
     This function expands any #include "*.blh" directives, transpiles the
@@ -1502,29 +1964,39 @@ def transpile_file(source_path: str, output_path: str, include_dirs: List[str] =
         source_path: Path to the .blcpp source file
         output_path: Path where the transpiled .cpp will be written
         include_dirs: Additional directories to search for .blh headers
+        cache: Header expansions shared with other transpile calls, if any
         
     Returns:
-        SourceMapping list for mapping output lines to (original_file, original_line)
+        SourceMapping for mapping output lines to (original_file, original_line)
+    """
+    with open(output_path, 'w', encoding='utf-8') as f:
+        return transpile_to_stream(source_path, f, include_dirs, cache)
+
+
+def transpile_to_stream(
+    source_path: str,
+    stream: TextIO,
+    include_dirs: List[str] = None,
+    cache: Optional[IncludeCache] = None
+) -> SourceMapping:
+    """Transpile a braceless C++ file, writing the regular C++ to a text stream.
+    
+    Same as transpile_file(), but the output goes to an already open stream.
     """
     # Expand .blh includes recursively
-    lines, blh_line_map = expand_blh_includes(source_path, include_dirs)
+    text, source_runs = expand_blh_includes(source_path, include_dirs, cache=cache)
     
     # Transpile the expanded content using the token-based compiler with line tracking
-    compiler = Compiler(lines)
-    output = compiler.compile()
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(output)
-    
-    # Build the full mapping: output_line -> (original_file, original_line)
-    source_mapping = []
-    for expanded_line in compiler.output.source_lines:
-        if expanded_line in blh_line_map:
-            source_mapping.append(blh_line_map[expanded_line])
-        else:
-            source_mapping.append(("<unknown>", expanded_line))
+    compiler = Compiler(text)
+    compiler.compile_to(stream)
     
-    return source_mapping
+    # Locations are resolved on lookup, so error-free builds never pay for them
+    return SourceMapping(compiler.output.source_runs(), source_runs, len(compiler.lines))
+
+
+# A response-file argument: runs of plain characters and "quoted" spans (which may
+# contain whitespace, and run to the end of the file if unterminated)
+RESPONSE_FILE_ARG_PATTERN = re.compile(r'(?:[^ \t\n\r"]+|"[^"]*(?:"|\Z))+')
 
 
 def expand_response_file(response_file: str) -> List[str]:
@@ -1533,20 +2005,11 @@ def expand_response_file(response_file: str) -> List[str]:
         filepath = response_file[1:]
         with open(filepath, 'r', encoding='utf-8') as f:
             content = f.read()
-        args = []
-        current = []
-        in_quotes = False
-        for char in content:
-            if char == '"':
-                in_quotes = not in_quotes
-            elif char in ' \t\n\r' and not in_quotes:
-                if current:
-                    args.append(''.join(current))
-                    current = []
-            else:
-                current.append(char)
-        if current:
-            args.append(''.join(current))
+        args = RESPONSE_FILE_ARG_PATTERN.findall(content)
+        if '"' in content:
+            # Only quoted arguments need rebuilding; the rest are the matched slices
+            args = [arg.replace('"', '') if '"' in arg else arg for arg in args]
+            args = [arg for arg in args if arg]
         return args
     except Exception:
         return [response_file]
@@ -1659,26 +2122,30 @@ def parse_msvc_args(args: List[str]) -> Tuple[List[str], Dict[str, str]]:
     return expanded_args, source_files
 
 
+@lru_cache(maxsize=4096)
 def _normalize_path(path: str) -> str:
     """Normalize a path for comparison"""
     return os.path.normcase(os.path.normpath(path))
 
 
-def _paths_match(path1: str, path2: str) -> bool:
-    """Check if two paths refer to the same file"""
-    if _normalize_path(path1) == _normalize_path(path2):
-        return True
-    return os.path.basename(path1).lower() == os.path.basename(path2).lower()
+@lru_cache(maxsize=4096)
+def _basename_lower(path: str) -> str:
+    """Lowercase file name of a path, for matching temp files by name alone"""
+    return os.path.basename(path).lower()
+
 
+# Mappings indexed by normalized temp path and by lowercase temp basename
+PathLookup = Tuple[Dict[str, SourceMapping], Dict[str, SourceMapping]]
 
-def _build_basename_map(file_mappings: Dict[str, SourceMapping]) -> Dict[str, str]:
-    """Build a map of basenames to temp paths"""
-    basename_to_temp = {}
-    for temp_path in file_mappings:
-        basename = os.path.basename(temp_path).lower()
-        if basename.endswith('.cpp'):
-            basename_to_temp[basename] = temp_path
-    return basename_to_temp
+
+def _build_path_lookup(file_mappings: Dict[str, SourceMapping]) -> PathLookup:
+    """Index the mappings so each error line needs only dict lookups"""
+    by_path = {}
+    by_basename = {}
+    for temp_path, mapping in file_mappings.items():
+        by_path[_normalize_path(temp_path)] = mapping
+        by_basename.setdefault(_basename_lower(temp_path), mapping)
+    return by_path, by_basename
 
 
 def _get_source_location(mapping: SourceMapping, transpiled_line: int) -> Tuple[str, int]:
@@ -1689,6 +2156,48 @@ def _get_source_location(mapping: SourceMapping, transpiled_line: int) -> Tuple[
     return ("<unknown>", transpiled_line)
 
 
+def _lookup_mapping(filepath: str, path_lookup: PathLookup) -> Optional[SourceMapping]:
+    """Find the mapping of the transpiled file a diagnostic refers to, if any."""
+    by_path, by_basename = path_lookup
+    mapping = by_path.get(_normalize_path(filepath))
+    if mapping is None:
+        mapping = by_basename.get(_basename_lower(filepath))
+    return mapping
+
+
+def _patch_error_line(
+    line: str,
+    path_lookup: PathLookup,
+    error_format: ErrorFormat
+) -> str:
+    """Patch a single line of compiler output (without its newline)."""
+    # Most output lines are not diagnostics; reject them without the regex
+    if error_format == ErrorFormat.MSVC:
+        if '(' not in line or ':' not in line:
+            return line
+        match = MSVC_ERROR_PATTERN.match(line)
+    else:
+        if ':' not in line:
+            return line
+        match = GNU_ERROR_PATTERN.match(line)
+    if not match:
+        return line
+    
+    mapping = _lookup_mapping(match.group(1), path_lookup)
+    if mapping is None:
+        return line
+    
+    # Get the original source file and line
+    original_path, source_line = _get_source_location(mapping, int(match.group(2)))
+    
+    # The match starts at the file path, so rebuild the location prefix and keep
+    # everything after the line number (column included) as is
+    rest = line[match.end(2):]
+    if error_format == ErrorFormat.MSVC:
+        return f'{original_path}({source_line}{rest}'
+    return f'{original_path}:{source_line}{rest}'
+
+
 def patch_compiler_output(
     output: str,
     file_mappings: Dict[str, SourceMapping],
@@ -1707,53 +2216,188 @@ def patch_compiler_output(
     Returns:
         Patched output with corrected file paths and line numbers
     """
-    basename_to_temp = _build_basename_map(file_mappings)
-    lines = output.split('\n')
-    patched_lines = []
+    path_lookup = _build_path_lookup(file_mappings)
+    return '\n'.join(_patch_error_line(line, path_lookup, error_format)
+                     for line in output.split('\n'))
+
+
+def _stream_patched_output(
+    pipe: TextIO,
+    out: TextIO,
+    file_mappings: Dict[str, SourceMapping],
+    error_format: ErrorFormat
+):
+    """Copy compiler output from pipe to out line by line, patching each line."""
+    path_lookup = _build_path_lookup(file_mappings)
+    for line in pipe:
+        body = line.rstrip('\n')
+        out.write(_patch_error_line(body, path_lookup, error_format))
+        out.write(line[len(body):])
+        out.flush()
+    pipe.close()
+
+
+def _resolve_executable(compiler_exe: str) -> str:
+    """Resolve a compiler name on PATH (including PATHEXT, e.g. emcc.bat on Windows)"""
+    return shutil.which(compiler_exe) or compiler_exe
+
+
+def _pass_through(wrapper_name: str, compiler_exe: str, args: List[str]) -> int:
+    """Run the compiler unmodified, replacing this process where the OS allows it."""
+    executable = _resolve_executable(compiler_exe)
+    try:
+        if os.name == 'posix':
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.execv(executable, [compiler_exe] + args)
+        return subprocess.run([executable] + args).returncode
+    except OSError as e:
+        print(f"{wrapper_name}: error: cannot run {compiler_exe}: {e}", file=sys.stderr)
+        return 127
+
+
+# Fewest translation units worth a process pool. Measured on Linux: starting a
+# worker costs about 5 ms with fork and 90 ms with spawn (the macOS/Windows
+# default), and a small TU takes about 150 ms to transpile. With 2-3 TUs the pool
+# saves at most one TU's time, which spawn start-up and imports mostly eat; from
+# 4 TUs on two or more CPUs it wins clearly. On one CPU it was slower at every count.
+_PARALLEL_TRANSPILE_MIN_FILES = 4
+
+
+# Header expansions shared by the translation units a transpile worker process
+# handles; the worker only lives for one compiler run. Set by _init_transpile_worker
+_worker_include_cache: Optional[IncludeCache] = None
+
+
+def _init_transpile_worker():
+    global _worker_include_cache
+    _worker_include_cache = IncludeCache()
+
+
+def _transpile_in_worker(source_path: str, output_path: str, include_dirs: List[str]) -> SourceMapping:
+    """transpile_file in a worker process, with the worker's shared IncludeCache"""
+    return transpile_file(source_path, output_path, include_dirs, _worker_include_cache)
+
+
+def _run_now(func, *args) -> Future:
+    """Run func in the calling process, returning its outcome as a completed Future"""
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _run_and_patch(
+    wrapper_name: str,
+    compiler_exe: str,
+    args: List[str],
+    file_mappings: Dict[str, SourceMapping],
+    error_format: ErrorFormat,
+    pass_fds: Tuple[int, ...] = (),
+    on_started: Optional[Callable[[], None]] = None
+) -> int:
+    """Run the compiler, patching its stdout and stderr as they are produced."""
+    try:
+        process = subprocess.Popen([_resolve_executable(compiler_exe)] + args,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   pass_fds=pass_fds)
+    except OSError as e:
+        print(f"{wrapper_name}: error: cannot run {compiler_exe}: {e}", file=sys.stderr)
+        return 127
+    finally:
+        if on_started is not None:
+            on_started()
     
-    pattern = MSVC_ERROR_PATTERN if error_format == ErrorFormat.MSVC else GNU_ERROR_PATTERN
+    # Drain both pipes concurrently so neither can fill up and block the compiler
+    pumps = [
+        threading.Thread(target=_stream_patched_output,
+                         args=(process.stdout, sys.stdout, file_mappings, error_format)),
+        threading.Thread(target=_stream_patched_output,
+                         args=(process.stderr, sys.stderr, file_mappings, error_format)),
+    ]
+    for pump in pumps:
+        pump.start()
+    for pump in pumps:
+        pump.join()
     
-    for line in lines:
-        match = pattern.match(line)
-        if match:
-            filepath = match.group(1)
-            line_num = int(match.group(2))
-            
-            matched_temp_path = None
-            for temp_path in file_mappings:
-                if _paths_match(filepath, temp_path):
-                    matched_temp_path = temp_path
-                    break
-            
-            if not matched_temp_path:
-                basename = os.path.basename(filepath).lower()
-                if basename in basename_to_temp:
-                    matched_temp_path = basename_to_temp[basename]
-            
-            if matched_temp_path:
-                mapping = file_mappings[matched_temp_path]
-                # Get the original source file and line
-                original_path, source_line = _get_source_location(mapping, line_num)
-                
-                if error_format == ErrorFormat.MSVC:
-                    column_part = match.group(3) or ''
-                    old_loc = f'({line_num}{column_part})'
-                    new_loc = f'({source_line}{column_part})'
-                    line = line.replace(filepath, original_path, 1)
-                    line = line.replace(old_loc, new_loc, 1)
-                else:
-                    col_part = match.group(3)
-                    if col_part:
-                        old_loc = f'{filepath}:{line_num}:{col_part}:'
-                        new_loc = f'{original_path}:{source_line}:{col_part}:'
-                    else:
-                        old_loc = f'{filepath}:{line_num}:'
-                        new_loc = f'{original_path}:{source_line}:'
-                    line = line.replace(old_loc, new_loc, 1)
-        
-        patched_lines.append(line)
+    return process.wait()
+
+
+# GCC-compatible drivers that read a source from an inherited /dev/fd/N path
+PIPE_INPUT_COMPILERS = frozenset(('gcc', 'g++', 'cc', 'c++', 'clang', 'clang++'))
+
+
+def _can_pipe_source(compiler_exe: str, args: List[str], blcpp_files: Dict[str, str]) -> bool:
+    """Check whether the transpiled source can be piped to the compiler instead of written to disk.
     
-    return '\n'.join(patched_lines)
+    Only done for a single source with an explicit -o, since the compiler would
+    otherwise name its output after the pipe. Dependency generation (-M*) is
+    excluded because the pipe path would end up in the generated rules.
+    """
+    if os.name != 'posix' or len(blcpp_files) != 1:
+        return False
+    if os.path.basename(compiler_exe) not in PIPE_INPUT_COMPILERS:
+        return False
+    if any(arg.startswith('-M') for arg in args):
+        return False
+    return any(arg.startswith('-o') for arg in args)
+
+
+def _run_with_piped_source(
+    wrapper_name: str,
+    compiler_exe: str,
+    all_args: List[str],
+    original_path: str,
+    include_dirs: List[str],
+    error_format: ErrorFormat,
+    verbose: bool
+) -> int:
+    """Transpile one source in memory and feed it to the compiler through a pipe."""
+    buffer = io.StringIO()
+    try:
+        mapping = transpile_to_stream(original_path, buffer, include_dirs)
+    except FileNotFoundError as e:
+        print(f"{wrapper_name}: error: {e}", file=sys.stderr)
+        return 1
+    except Exception as e:
+        print(f"{wrapper_name}: error transpiling {original_path}: {e}", file=sys.stderr)
+        return 1
+    
+    read_fd, write_fd = os.pipe()
+    pipe_path = f'/dev/fd/{read_fd}'
+    new_args = []
+    for arg in all_args:
+        if arg == original_path:
+            # The pipe path has no extension, so set the language explicitly
+            new_args += ['-x', 'c++', pipe_path, '-x', 'none']
+        else:
+            new_args.append(arg)
+    
+    if verbose:
+        print(f"[{wrapper_name}] Transpiling: {original_path} -> {pipe_path}", file=sys.stderr)
+        print(f"[{wrapper_name}] Running: {compiler_exe} {' '.join(new_args)}", file=sys.stderr)
+    
+    def write_source():
+        try:
+            with os.fdopen(write_fd, 'w', encoding='utf-8') as pipe:
+                pipe.write(buffer.getvalue())
+        except BrokenPipeError:
+            # The compiler stopped reading (e.g. it failed to start); it reports why
+            pass
+    
+    # The source can be larger than the pipe buffer (64 KiB on Linux), and the compiler
+    # may stop reading it while it blocks writing diagnostics we have not drained yet.
+    # Writing from a thread lets the source and the compiler's output flow at the same time
+    writer = threading.Thread(target=write_source)
+    writer.start()
+    try:
+        return _run_and_patch(wrapper_name, compiler_exe, new_args, {pipe_path: mapping},
+                              error_format, pass_fds=(read_fd,),
+                              on_started=lambda: os.close(read_fd))
+    finally:
+        writer.join()
 
 
 def run_compiler_wrapper(
@@ -1763,67 +2407,90 @@ def run_compiler_wrapper(
     parse_args_func,
     error_format: ErrorFormat,
     verbose: bool = False,
-    keep_temp: bool = False
+    keep_temp: bool = False,
+    pipe_source: bool = False
 ) -> int:
     """Generic compiler wrapper runner."""
-    all_args, source_files = parse_args_func(args)
-    blcpp_files = {path: path for path in source_files if is_blcpp_file(path)}
+    # Cheap check before parsing: a .blcpp source must appear in argv itself
+    # or come from a response file
+    if any('.blcpp' in arg.lower() or arg.startswith('@') for arg in args):
+        all_args, source_files = parse_args_func(args)
+        blcpp_files = {path: path for path in source_files if is_blcpp_file(path)}
+    else:
+        blcpp_files = {}
     
     if not blcpp_files:
         if verbose:
             print(f"[{wrapper_name}] No .blcpp files found, passing through to: {compiler_exe}", file=sys.stderr)
-        cmd = subprocess.list2cmdline([compiler_exe] + args)
-        result = subprocess.run(cmd, capture_output=False, shell=True)
-        return result.returncode
+        return _pass_through(wrapper_name, compiler_exe, args)
+    
+    # Extract include directories for .blh resolution
+    include_dirs = extract_include_dirs(all_args)
+    
+    if pipe_source and not keep_temp and _can_pipe_source(compiler_exe, all_args, blcpp_files):
+        original_path, = blcpp_files
+        return _run_with_piped_source(wrapper_name, compiler_exe, all_args, original_path,
+                                      include_dirs, error_format, verbose)
     
     temp_dir = tempfile.mkdtemp(prefix=f'{wrapper_name}_')
     
     if verbose:
         print(f"[{wrapper_name}] Temp directory: {temp_dir}", file=sys.stderr)
     
-    # Extract include directories for .blh resolution
-    include_dirs = extract_include_dirs(all_args)
-    
     try:
         file_mappings = {}
-        new_args = list(all_args)
         
+        temp_paths = {}
+        used_temp_names = set()
         for original_path in blcpp_files:
-            base_name = os.path.basename(original_path)
-            temp_name = os.path.splitext(base_name)[0] + '.cpp'
-            temp_path = os.path.join(temp_dir, temp_name)
+            stem = os.path.splitext(os.path.basename(original_path))[0]
+            temp_name = stem + '.cpp'
+            # Sources from different directories may share a basename
+            suffix = 1
+            while temp_name.lower() in used_temp_names:
+                temp_name = f'{stem}_{suffix}.cpp'
+                suffix += 1
+            used_temp_names.add(temp_name.lower())
+            temp_paths[original_path] = os.path.join(temp_dir, temp_name)
+            if verbose:
+                print(f"[{wrapper_name}] Transpiling: {original_path} -> {temp_paths[original_path]}", file=sys.stderr)
+        
+        # Translation units are independent, so transpile them in parallel
+        # when there are enough of them to pay for starting the workers
+        cpu_count = os.cpu_count() or 1
+        if len(temp_paths) >= _PARALLEL_TRANSPILE_MIN_FILES and cpu_count > 1:
+            executor = ProcessPoolExecutor(max_workers=min(len(temp_paths), cpu_count),
+                                           initializer=_init_transpile_worker)
+            submit = executor.submit
+            transpile = _transpile_in_worker
+        else:
+            executor = None
+            submit = _run_now
+            transpile = partial(transpile_file, cache=IncludeCache())
+        
+        try:
+            futures = [(original_path, temp_path, submit(transpile, original_path, temp_path, include_dirs))
+                       for original_path, temp_path in temp_paths.items()]
             
-            try:
-                if verbose:
-                    print(f"[{wrapper_name}] Transpiling: {original_path} -> {temp_path}", file=sys.stderr)
-                mapper = transpile_file(original_path, temp_path, include_dirs)
-                file_mappings[temp_path] = mapper
-                
-                for i, arg in enumerate(new_args):
-                    if arg == original_path:
-                        new_args[i] = temp_path
-            except FileNotFoundError as e:
-                print(f"{wrapper_name}: error: {e}", file=sys.stderr)
-                return 1
-            except Exception as e:
-                print(f"{wrapper_name}: error transpiling {original_path}: {e}", file=sys.stderr)
-                return 1
+            for original_path, temp_path, future in futures:
+                try:
+                    file_mappings[temp_path] = future.result()
+                except FileNotFoundError as e:
+                    print(f"{wrapper_name}: error: {e}", file=sys.stderr)
+                    return 1
+                except Exception as e:
+                    print(f"{wrapper_name}: error transpiling {original_path}: {e}", file=sys.stderr)
+                    return 1
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        
+        new_args = [temp_paths.get(arg, arg) for arg in all_args]
         
         if verbose:
             print(f"[{wrapper_name}] Running: {compiler_exe} {' '.join(new_args)}", file=sys.stderr)
         
-        cmd = subprocess.list2cmdline([compiler_exe] + new_args)
-        result = subprocess.run(cmd, capture_output=True, text=True, shell=True)
-        
-        if result.stdout:
-            patched = patch_compiler_output(result.stdout, file_mappings, error_format)
-            print(patched, end='')
-        
-        if result.stderr:
-            patched = patch_compiler_output(result.stderr, file_mappings, error_format)
-            print(patched, end='', file=sys.stderr)
-        
-        return result.returncode
+        return _run_and_patch(wrapper_name, compiler_exe, new_args, file_mappings, error_format)
         
     finally:
         if not keep_temp:
@@ -1869,7 +2536,8 @@ def compiler_main(compiler_exe: str, args: List[str]):
     
     verbose = '--verbose' in args
     keep_temp = '--keep-temp' in args
-    args = [arg for arg in args if arg not in ('--verbose', '--keep-temp')]
+    pipe_source = '--pipe' in args
+    args = [arg for arg in args if arg not in ('--verbose', '--keep-temp', '--pipe')]
     
     exit_code = run_compiler_wrapper(
         wrapper_name='braceless',
@@ -1879,6 +2547,7 @@ def compiler_main(compiler_exe: str, args: List[str]):
         error_format=error_format,
         verbose=verbose,
         keep_temp=keep_temp,
+        pipe_source=pipe_source,
     )
     sys.exit(exit_code)
 
@@ -1890,6 +2559,7 @@ def print_usage():
     print("Usage:", file=sys.stderr)
     print("  braceless <compiler> [compiler options] <source files>", file=sys.stderr)
     print("  braceless <input.blcpp> [-I<include_dir>]...  (transpile only)", file=sys.stderr)
+    print("  braceless --batch [-I<include_dir>]...  (transpile each file named on stdin)", file=sys.stderr)
     print("", file=sys.stderr)
     print("Examples:", file=sys.stderr)
     print("  braceless clang++ main.blcpp -o main", file=sys.stderr)
@@ -1902,6 +2572,110 @@ def print_usage():
     print("Options:", file=sys.stderr)
     print("  --verbose    Show verbose output", file=sys.stderr)
     print("  --keep-temp  Don't delete temporary transpiled files", file=sys.stderr)
+    print("  --pipe       Pipe a single transpiled source to gcc/clang instead of", file=sys.stderr)
+    print("               writing a temp file (POSIX, needs -o; no source excerpts", file=sys.stderr)
+    print("               in diagnostics)", file=sys.stderr)
+    print("  --cache-dir=<dir>  (transpile only) Reuse transpiled output stored in <dir>;", file=sys.stderr)
+    print("               set BLCC_NO_CACHE=1 to bypass it", file=sys.stderr)
+
+
+@lru_cache(maxsize=1)
+def _transpiler_digest() -> bytes:
+    """Hash identifying this transpiler and the libclang it tokenizes with.
+    
+    Covers this file's contents plus the path, size and mtime of the clang
+    bindings and the libclang library, so cached output is dropped when the
+    transpiler changes or libclang is upgraded.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    for path in (clang.cindex.__file__, clang.cindex.conf.get_filename()):
+        digest.update(os.fsencode(path))
+        try:
+            st = os.stat(path)
+            digest.update(f' {st.st_size} {st.st_mtime_ns}\n'.encode())
+        except OSError:
+            # A bare library name resolved by the loader; the name is all there is
+            digest.update(b' -\n')
+    return digest.digest()
+
+
+def transpile_cached(text: str, stream: TextIO, cache_dir: Optional[str]):
+    """Transpile expanded source text to a stream, reusing an earlier result from cache_dir.
+    
+    Results are keyed by the expanded text (so included headers are covered)
+    and by _transpiler_digest(). Output is always produced by compile_to, so
+    the cache can't change it. With no cache_dir, or with BLCC_NO_CACHE=1
+    set, this is just Compiler(text).compile_to(stream).
+    """
+    if not cache_dir or os.environ.get('BLCC_NO_CACHE') == '1':
+        Compiler(text).compile_to(stream)
+        return
+    
+    key = hashlib.blake2b(_transpiler_digest(), digest_size=16)
+    key.update(text.encode('utf-8', 'surrogatepass'))
+    cache_file = os.path.join(cache_dir, key.hexdigest() + '.cpp')
+    try:
+        with open(cache_file, 'r', encoding='utf-8', newline='') as f:
+            cached = f.read()
+    except (OSError, UnicodeDecodeError):
+        # Missing, unreadable or corrupt entries are all misses; recompile and overwrite
+        pass
+    else:
+        stream.write(cached)
+        return
+    
+    buffer = io.StringIO()
+    Compiler(text).compile_to(buffer)
+    output = buffer.getvalue()
+    # The cache is only a shortcut, so failing to write it is not an error. Write
+    # under a temporary name first so concurrent runs never read a partial file
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.write(output)
+            os.replace(temp_path, cache_file)
+        except OSError:
+            os.unlink(temp_path)
+    except OSError:
+        pass
+    stream.write(output)
+
+
+def run_batch(include_dirs: List[str], cache_dir: Optional[str] = None):
+    """Transpile each file named on stdin (one per line) in this process.
+    
+    Saves the interpreter and libclang startup per file for callers with many
+    inputs, such as the test runner. Each file produces one record on stdout:
+    a header line '---FILE <status> <output length> <error length> <name>'
+    followed by the transpiled text and then the error text. Status is 0 on
+    success. The record is written as bytes in stdout's encoding, without
+    newline translation, and the lengths are in bytes.
+    """
+    out = sys.stdout.buffer
+    encoding, errors = sys.stdout.encoding, sys.stdout.errors
+    for line in sys.stdin:
+        filename = line.rstrip('\r\n')
+        if not filename:
+            continue
+        output = ''
+        status, error = 0, ''
+        try:
+            text, _ = expand_blh_includes(filename, include_dirs)
+            buffer = io.StringIO()
+            transpile_cached(text, buffer, cache_dir)
+            output = buffer.getvalue()
+        except Exception as e:
+            status, error = 1, f"Error: {e}\n"
+        output_bytes = output.encode(encoding, errors)
+        error_bytes = error.encode(encoding, errors)
+        out.write(f"---FILE {status} {len(output_bytes)} {len(error_bytes)} {filename}\n".encode(encoding, errors))
+        out.write(output_bytes)
+        out.write(error_bytes)
+        out.flush()
 
 
 def is_compiler_name(arg: str) -> bool:
@@ -1938,9 +2712,15 @@ def main():
     # Otherwise, run as transpiler (braceless <file.blcpp> [-I...])
     filename = None
     include_dirs = []
+    batch = False
+    cache_dir = None
     
     for arg in sys.argv[1:]:
-        if arg.startswith('-I'):
+        if arg == '--batch':
+            batch = True
+        elif arg.startswith('--cache-dir='):
+            cache_dir = arg[len('--cache-dir='):]
+        elif arg.startswith('-I'):
             include_dirs.append(arg[2:])
         elif arg == '-I':
             continue  # Next arg will be the directory
@@ -1949,16 +2729,18 @@ def main():
         elif sys.argv[sys.argv.index(arg) - 1] == '-I':
             include_dirs.append(arg)
     
+    if batch:
+        run_batch(include_dirs, cache_dir)
+        return
+    
     if not filename:
         print("Error: No input file specified", file=sys.stderr)
         sys.exit(1)
     
     try:
         # Expand .blh includes and transpile
-        lines, _ = expand_blh_includes(filename, include_dirs)
-        compiler = Compiler(lines)
-        output = compiler.compile()
-        print(output, end='')
+        text, _ = expand_blh_includes(filename, include_dirs)
+        transpile_cached(text, sys.stdout, cache_dir)
     except FileNotFoundError as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,15 @@
+// Test: Inline braceless lambdas with trailing comments and strings
+// Brackets and colons inside strings/comments must not confuse lambda detection
+
+int main() {
+    auto combined = combine(
+        [](int x) { // doubles the value
+            return x * 2; // twice
+        },
+        [](int y) {
+            log("[y]:");
+            return y + 1;
+        }
+    );
+    return combined(5);
+}
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Shared fixtures for the header tests.
+"""
+
+import unittest
+import os
+import tempfile
+
+
+class SharedTempDirTestCase(unittest.TestCase):
+    """Base for tests that write files: one temp dir per class, removed at the end.
+
+    Each test still gets its own empty subdirectory as self.temp_dir.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory(prefix='blcc_test_')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(dir=self._tmp.name)
+
+    def write(self, name: str, text: str) -> str:
+        """Write a UTF-8 file under self.temp_dir, creating its directories; returns its path"""
+        path = os.path.join(self.temp_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
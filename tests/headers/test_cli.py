@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for braceless.py's transpile-only command line.
+
+These tests verify that:
+1. --cache-dir never changes the transpiled output
+2. --batch frames each file's output by its length in bytes
+"""
+
+import unittest
+import sys
+import os
+import subprocess
+
+BRACELESS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                         'braceless.py')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_tests import run_blcc, run_blcc_batch
+from support import SharedTempDirTestCase
+
+
+def run_braceless(*args: str, input: bytes = None) -> subprocess.CompletedProcess:
+    """Run braceless.py, returning its raw stdout and stderr bytes"""
+    env = dict(os.environ)
+    env.pop('BLCC_NO_CACHE', None)
+    return subprocess.run([sys.executable, BRACELESS, *args], input=input,
+                          capture_output=True, timeout=60, env=env)
+
+
+class TestTranspileCache(SharedTempDirTestCase):
+    """Tests for --cache-dir"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+
+    def assert_cache_keeps_output(self, source: str):
+        uncached = run_braceless(source)
+        self.assertEqual(uncached.returncode, 0, uncached.stderr)
+        # The first cached run fills the cache, the second is served from it
+        for _ in range(2):
+            cached = run_braceless(source, f'--cache-dir={self.cache_dir}')
+            self.assertEqual(cached.returncode, 0, cached.stderr)
+            self.assertEqual(cached.stdout, uncached.stdout)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_cache_keeps_output(self):
+        """Cached and uncached runs print the same bytes"""
+        self.assert_cache_keeps_output(self.write('main.blcpp', 'int main():\n    return 0\n'))
+
+    def test_cache_keeps_empty_output(self):
+        """An empty source prints a lone newline with or without the cache"""
+        source = self.write('empty.blcpp', '')
+        self.assert_cache_keeps_output(source)
+        self.assertEqual(run_braceless(source).stdout.replace(b'\r\n', b'\n'), b'\n')
+
+    def test_corrupt_cache_entry_is_a_miss(self):
+        """A cache entry that isn't valid UTF-8 is recompiled and replaced"""
+        source = self.write('main.blcpp', 'int main():\n    return 0\n')
+        self.assert_cache_keeps_output(source)
+        cache_file = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        with open(cache_file, 'wb') as f:
+            f.write(b'int main() {\n\xff\xfe')
+        self.assert_cache_keeps_output(source)
+
+
+class TestBatch(SharedTempDirTestCase):
+    """Tests for --batch and the test runner's reading of it"""
+
+    def setUp(self):
+        super().setUp()
+        self.sources = [
+            self.write('accents.blcpp', '// caf\u00e9 \u2713\nint main():\n    return 0\n'),
+            os.path.join(self.temp_dir, 'missing\r.blcpp'),
+            self.write('plain.blcpp', 'int f():\n    return 1\n'),
+        ]
+
+    def test_lengths_are_bytes(self):
+        """Each record's lengths cover exactly its output and error bytes"""
+        result = run_braceless('--batch', input=''.join(f'{source}\n' for source in self.sources).encode())
+        self.assertEqual(result.returncode, 0, result.stderr)
+        output = result.stdout
+        pos = 0
+        records = []
+        for source in self.sources:
+            header_end = output.index(b'\n', pos)
+            tag, status, stdout_len, stderr_len, name = output[pos:header_end].decode().split(' ', 4)
+            self.assertEqual((tag, name), ('---FILE', source))
+            stdout_start = header_end + 1
+            stderr_start = stdout_start + int(stdout_len)
+            pos = stderr_start + int(stderr_len)
+            records.append((status, output[stdout_start:stderr_start], output[stderr_start:pos]))
+        self.assertEqual(pos, len(output))
+        
+        self.assertEqual(records[0][0], '0')
+        self.assertEqual(records[0][1], run_braceless(self.sources[0]).stdout)
+        self.assertIn('caf\u00e9 \u2713'.encode(), records[0][1])
+        self.assertEqual(records[1][0], '1')
+        self.assertEqual(records[2][1], run_braceless(self.sources[2]).stdout)
+
+    def test_runner_batch_matches_single_runs(self):
+        """run_blcc_batch gives the same results as one run_blcc per file"""
+        self.assertEqual(run_blcc_batch(BRACELESS, self.sources),
+                         [run_blcc(BRACELESS, source) for source in self.sources])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,14 +11,13 @@ import unittest
 import sys
 import os
 import re
-from typing import Dict, Tuple, Optional
-from dataclasses import dataclass
+from typing import Dict, Tuple, Optional, NamedTuple
+from functools import lru_cache
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 
-@dataclass
-class SourceLocation:
+class SourceLocation(NamedTuple):
     """Represents a location in a source file"""
     file: str
     line: int
@@ -28,18 +27,40 @@ class SourceLocation:
 # Error message patterns (from blcc.py, extended for chained mapping)
 # =============================================================================
 
+# Both patterns are MULTILINE so they can be run over a whole output buffer;
+# whitespace is [^\S\n] so a match never spans lines.
+
 # MSVC-style: file(line): or file(line,col):
 MSVC_ERROR_PATTERN = re.compile(
-    r'^(.*?)\((\d+)(,\d+)?\)\s*:\s*(error|warning|note|fatal error)',
-    re.IGNORECASE
+    r'^(.*?)\((\d+)(,\d+)?\)[^\S\n]*:[^\S\n]*(error|warning|note|fatal error)',
+    re.IGNORECASE | re.MULTILINE
 )
 
 # GNU-style: file:line:col: or file:line:
 GNU_ERROR_PATTERN = re.compile(
-    r'^(.+?):(\d+):(\d+)?:?\s*(error|warning|note|fatal error)',
-    re.IGNORECASE
+    r'^(.+?):(\d+):(\d+)?:?[^\S\n]*(error|warning|note|fatal error)',
+    re.IGNORECASE | re.MULTILINE
 )
 
+def _relocate(
+    match: re.Match,
+    temp_key: Tuple[str, str],
+    line_map: Dict[int, SourceLocation],
+    line_open: str
+) -> str:
+    """Return the matched diagnostic prefix with the original file/line.
+    
+    The match starts at the file path, so the new prefix is the original
+    file, line_open (':' or '('), the original line and everything after the
+    transpiled line number. Returns the match unchanged if it is not ours.
+    """
+    if not _matches_temp_file(match.group(1), temp_key):
+        return match.group(0)
+    loc = line_map.get(int(match.group(2)))
+    if loc is None:
+        return match.group(0)
+    return f"{loc.file}{line_open}{loc.line}{match.string[match.end(2):match.end()]}"
+
 
 def patch_error_line_gnu(
     error_line: str,
@@ -56,34 +77,13 @@ def patch_error_line_gnu(
     Returns:
         Patched error line with original file/line, or original if no match
     """
+    # Context lines (source excerpts, carets) have no ':' and can't match
+    if ':' not in error_line:
+        return error_line
     match = GNU_ERROR_PATTERN.match(error_line)
     if not match:
         return error_line
-    
-    filepath = match.group(1)
-    line_num = int(match.group(2))
-    col = match.group(3)
-    
-    # Check if this error is from our temp file
-    # Normalize paths for comparison
-    if not _paths_match(filepath, temp_file):
-        return error_line
-    
-    # Look up the original location
-    if line_num not in line_map:
-        return error_line
-    
-    loc = line_map[line_num]
-    
-    # Build the replacement
-    if col:
-        old_prefix = f"{filepath}:{line_num}:{col}:"
-        new_prefix = f"{loc.file}:{loc.line}:{col}:"
-    else:
-        old_prefix = f"{filepath}:{line_num}:"
-        new_prefix = f"{loc.file}:{loc.line}:"
-    
-    return error_line.replace(old_prefix, new_prefix, 1)
+    return _relocate(match, _temp_file_key(temp_file), line_map, ':') + error_line[match.end():]
 
 
 def patch_error_line_msvc(
@@ -101,43 +101,38 @@ def patch_error_line_msvc(
     Returns:
         Patched error line with original file/line, or original if no match
     """
+    if '(' not in error_line or ':' not in error_line:
+        return error_line
     match = MSVC_ERROR_PATTERN.match(error_line)
     if not match:
         return error_line
-    
-    filepath = match.group(1)
-    line_num = int(match.group(2))
-    col_part = match.group(3) or ''
-    
-    # Check if this error is from our temp file
-    if not _paths_match(filepath, temp_file):
-        return error_line
-    
-    # Look up the original location
-    if line_num not in line_map:
-        return error_line
-    
-    loc = line_map[line_num]
-    
-    # Build the replacement
-    old_loc = f"({line_num}{col_part})"
-    new_loc = f"({loc.line}{col_part})"
-    
-    result = error_line.replace(filepath, loc.file, 1)
-    result = result.replace(old_loc, new_loc, 1)
-    
-    return result
+    return _relocate(match, _temp_file_key(temp_file), line_map, '(') + error_line[match.end():]
+
+
+# Compiler output names the same few files over and over, so normalize each once
+@lru_cache(maxsize=4096)
+def _norm(path: str) -> str:
+    return os.path.normcase(os.path.normpath(path))
+
+
+@lru_cache(maxsize=4096)
+def _basename_lower(path: str) -> str:
+    # Split on either separator, so Windows-style paths match on any host
+    return path[max(path.rfind('/'), path.rfind('\\')) + 1:].lower()
 
 
-def _paths_match(path1: str, path2: str) -> bool:
-    """Check if two paths refer to the same file (case-insensitive on Windows)"""
-    import os
-    norm1 = os.path.normcase(os.path.normpath(path1))
-    norm2 = os.path.normcase(os.path.normpath(path2))
-    if norm1 == norm2:
+def _temp_file_key(temp_file: str) -> Tuple[str, str]:
+    """Normalized path and lowercase basename of the temp file, for _matches_temp_file"""
+    return _norm(temp_file), _basename_lower(temp_file)
+
+
+def _matches_temp_file(path: str, temp_key: Tuple[str, str]) -> bool:
+    """Check if a path refers to the temp file (case-insensitive on Windows)"""
+    norm_temp, base_temp = temp_key
+    if _norm(path) == norm_temp:
         return True
     # Also check basename match for temp files
-    return os.path.basename(path1).lower() == os.path.basename(path2).lower()
+    return _basename_lower(path) == base_temp
 
 
 def patch_compiler_output(
@@ -157,11 +152,14 @@ def patch_compiler_output(
     Returns:
         Patched output with corrected file/line references
     """
-    patch_func = patch_error_line_msvc if is_msvc else patch_error_line_gnu
+    if is_msvc:
+        pattern, line_open = MSVC_ERROR_PATTERN, '('
+    else:
+        pattern, line_open = GNU_ERROR_PATTERN, ':'
     
-    lines = output.split('\n')
-    patched = [patch_func(line, temp_file, line_map) for line in lines]
-    return '\n'.join(patched)
+    # One regex pass over the whole buffer; only diagnostic prefixes are rebuilt
+    temp_key = _temp_file_key(temp_file)
+    return pattern.sub(lambda match: _relocate(match, temp_key, line_map, line_open), output)
 
 
 # =============================================================================
@@ -283,6 +281,12 @@ class TestMsvcErrorPatching(unittest.TestCase):
         result = patch_error_line_msvc(error, self.temp_file, self.line_map)
         self.assertEqual(result, error)
 
+    def test_patch_relative_path(self):
+        """A relative Windows path to the temp file is matched by its file name"""
+        error = r"blcc_xyz123\MAIN.cpp(5): error C2143: syntax error: missing ';'"
+        result = patch_error_line_msvc(error, self.temp_file, self.line_map)
+        self.assertEqual(result, "math_utils.blh(3): error C2143: syntax error: missing ';'")
+
 
 class TestFullOutputPatching(unittest.TestCase):
     """Tests for patching complete compiler output"""
@@ -455,6 +459,29 @@ main.obj : error LNK2019: unresolved external symbol "void __cdecl foo(void)"
         result = patch_compiler_output(output, r"C:\temp\main.cpp", {}, is_msvc=True)
         self.assertEqual(result, output)  # Unchanged - linker error
 
+    def test_gnu_message_with_msvc_shape(self):
+        """A GNU diagnostic whose message contains '(N): error' is still patched"""
+        line_map = {2: SourceLocation("main.blcpp", 2)}
+        output = "/tmp/t.cpp:2:3: error: no match for f(3): error here\n"
+        result = patch_compiler_output(output, "/tmp/t.cpp", line_map, False)
+        self.assertEqual(result, "main.blcpp:2:3: error: no match for f(3): error here\n")
+
+    def test_format_follows_is_msvc(self):
+        """Only diagnostics in the requested format are patched"""
+        temp_file = r"C:\temp\main.cpp"
+        line_map = {
+            5: SourceLocation("main.blcpp", 3),
+            9: SourceLocation("utils.blh", 7),
+        }
+        output = (
+            "C:\\temp\\main.cpp(5,2): error C2065: 'x': undeclared identifier\n"
+            "C:\\temp\\main.cpp:9:4: warning: unused variable 'y'\n"
+        )
+        self.assertEqual(patch_compiler_output(output, temp_file, line_map, is_msvc=True), (
+            "main.blcpp(3,2): error C2065: 'x': undeclared identifier\n"
+            "C:\\temp\\main.cpp:9:4: warning: unused variable 'y'\n"
+        ))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for .blh header expansion in braceless.py.
+
+These tests verify that:
+1. Repeated expansions see edits made to headers in between
+2. Headers that include each other are expanded once
+3. A shared IncludeCache gives the same result as fresh expansions
+"""
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from braceless import expand_blh_includes, IncludeCache
+from support import SharedTempDirTestCase
+
+
+class TestExpandBlhIncludes(SharedTempDirTestCase):
+    """Tests for expand_blh_includes"""
+
+    def test_edited_header_is_read_again(self):
+        """A second expansion picks up a header edited after the first"""
+        main = self.write('main.blcpp', '#include "h.blh"\nint main()\n')
+        self.write('h.blh', 'int a()\n')
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, 'int a()\nint main()\n')
+
+        self.write('h.blh', 'int b_changed()\n')
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, 'int b_changed()\nint main()\n')
+
+    def test_same_size_edit_is_read_again(self):
+        """An edit that keeps the file size is still seen through its mtime"""
+        main = self.write('main.blcpp', '#include "h.blh"\nint main()\n')
+        header = self.write('h.blh', 'int a()\n')
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, 'int a()\nint main()\n')
+
+        mtime_ns = os.stat(header).st_mtime_ns
+        self.write('h.blh', 'int b()\n')
+        os.utime(header, ns=(mtime_ns + 1_000_000_000, mtime_ns + 1_000_000_000))
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, 'int b()\nint main()\n')
+
+    def test_header_created_after_first_expansion(self):
+        """A header that was missing is found once it exists"""
+        main = self.write('main.blcpp', '#include "late.blh"\nint main()\n')
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, '#include "late.blh"\nint main()\n')
+
+        self.write('late.blh', 'int late()\n')
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, 'int late()\nint main()\n')
+
+    def test_header_deleted_after_first_expansion(self):
+        """A header that was removed is no longer found"""
+        main = self.write('main.blcpp', '#include "gone.blh"\nint main()\n')
+        header = self.write('gone.blh', 'int gone()\n')
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, 'int gone()\nint main()\n')
+
+        os.remove(header)
+        text, _ = expand_blh_includes(main)
+        self.assertEqual(text, '#include "gone.blh"\nint main()\n')
+
+    def test_headers_including_each_other(self):
+        """Mutually including headers are each expanded once"""
+        main = self.write('main.blcpp', '#include "a.blh"\nint main()\n')
+        self.write('a.blh', '#include "b.blh"\nint a()\n')
+        self.write('b.blh', '#include "a.blh"\nint b()\n')
+        text, source_runs = expand_blh_includes(main)
+        self.assertEqual(text, 'int b()\nint a()\nint main()\n')
+        self.assertEqual(os.path.basename(source_runs.locate(0)[0]), 'b.blh')
+        self.assertEqual(source_runs.locate(2)[1], 2)
+
+    def test_shared_cache_matches_fresh_expansion(self):
+        """Reusing cached header expansions doesn't change the result"""
+        self.write('common.blh', '#include "inner.blh"\nint common()\n')
+        self.write('inner.blh', 'int inner()\n')
+        first = self.write('first.blcpp', '#include "common.blh"\nint first()\n')
+        second = self.write('second.blcpp', '#include "inner.blh"\n#include "common.blh"\nint second()\n')
+
+        cache = IncludeCache()
+        for source in (first, second, first):
+            shared_text, shared_runs = expand_blh_includes(source, cache=cache)
+            fresh_text, fresh_runs = expand_blh_includes(source)
+            self.assertEqual(shared_text, fresh_text)
+            line_count = shared_text.count('\n')
+            self.assertEqual([shared_runs.locate(i) for i in range(line_count)],
+                             [fresh_runs.locate(i) for i in range(line_count)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,27 +15,39 @@ import unittest
 import sys
 import os
 import subprocess
-import tempfile
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterator, Optional, Tuple, Union
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 # Import test utilities from sibling modules
 from test_preprocessor import (
-    parse_line_marker, build_line_map, strip_line_markers,
+    parse_line_marker, build_line_map, build_line_map_streaming, strip_line_markers,
+    parse_preprocessor,
     SourceLocation, LineMarker
 )
 from test_error_mapping import patch_compiler_output
+from support import SharedTempDirTestCase
 
 
 # =============================================================================
 # Helper functions for integration tests
 # =============================================================================
 
+@lru_cache(maxsize=1)
 def find_compiler() -> Optional[str]:
-    """Find an available C++ compiler for preprocessing."""
+    """Find an available C++ compiler for preprocessing.
+    
+    BLCC_CXX, if set, names the compiler and skips the PATH search. The
+    result is cached for all test classes.
+    """
+    pinned = os.environ.get('BLCC_CXX')
+    if pinned:
+        return pinned
     compilers = ['clang++', 'clang', 'g++', 'gcc', 'cl']
     for compiler in compilers:
         if shutil.which(compiler):
@@ -46,19 +58,30 @@ def find_compiler() -> Optional[str]:
 def run_preprocessor(
     compiler: str,
     source_file: str,
-    include_dirs: list = None
-) -> Tuple[bool, str, str]:
+    include_dirs: list = None,
+    text: bool = True,
+    markers: bool = True
+) -> Tuple[bool, Union[str, bytes], str]:
     """Run the C preprocessor on a source file.
     
     Args:
         compiler: Path to compiler executable
         source_file: Path to source file
         include_dirs: List of include directories
+        text: Decode stdout; with False it is returned as raw bytes, which
+            build_line_map and strip_line_markers accept as they are
+        markers: Emit line markers. Without them (-P for gcc/clang, /EP for
+            MSVC) stdout is just the content, for callers that need no line map
         
     Returns:
         (success, stdout, stderr)
     """
-    cmd = [compiler, '-E']
+    if markers:
+        cmd = [compiler, '-E']
+    elif os.path.splitext(os.path.basename(compiler))[0].lower() == 'cl':
+        cmd = [compiler, '-EP']
+    else:
+        cmd = [compiler, '-E', '-P']
     
     # Add include directories
     if include_dirs:
@@ -71,14 +94,59 @@ def run_preprocessor(
         result = subprocess.run(
             cmd,
             capture_output=True,
-            text=True,
+            text=text,
             timeout=30
         )
-        return (result.returncode == 0, result.stdout, result.stderr)
+        stderr = result.stderr if text else result.stderr.decode(errors='replace')
+        return (result.returncode == 0, result.stdout, stderr)
     except subprocess.TimeoutExpired:
-        return (False, '', 'Preprocessor timed out')
+        return (False, '' if text else b'', 'Preprocessor timed out')
     except Exception as e:
-        return (False, '', str(e))
+        return (False, '' if text else b'', str(e))
+
+
+def stream_preprocessor_lines(
+    compiler: str,
+    source_file: str,
+    include_dirs: list = None
+) -> Iterator[str]:
+    """Run the C preprocessor and yield its output lines as they are produced.
+    
+    Lets the caller parse the output (e.g. with build_line_map_streaming)
+    while the preprocessor is still running.
+    
+    Raises:
+        subprocess.CalledProcessError: If the preprocessor fails (raised once
+            the output is exhausted; stderr is attached)
+    """
+    cmd = [compiler, '-E']
+    for inc_dir in include_dirs or ():
+        cmd.extend(['-I', inc_dir])
+    cmd.append(source_file)
+    
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True, bufsize=1) as proc:
+        # Drain stderr alongside, so a chatty preprocessor can't block on a full pipe
+        stderr_parts = []
+        stderr_reader = threading.Thread(target=lambda: stderr_parts.append(proc.stderr.read()))
+        stderr_reader.start()
+        yield from proc.stdout
+        stderr_reader.join()
+        returncode = proc.wait(timeout=30)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=''.join(stderr_parts))
+
+
+def locate_content_line(line_map, content: str, text: str) -> Optional[Tuple[str, int]]:
+    """(file name, line) of the first preprocessed content line that reads text.
+    
+    Indentation is ignored. Returns None if no content line reads text.
+    """
+    for output_line, line in enumerate(content.split('\n'), 1):
+        if line.strip() == text:
+            location = line_map[output_line]
+            return os.path.basename(location.file), location.line
+    return None
 
 
 def simulate_transpilation_mapping(preprocessed_lines: int) -> Dict[int, int]:
@@ -94,11 +162,12 @@ def simulate_transpilation_mapping(preprocessed_lines: int) -> Dict[int, int]:
 # Test Cases
 # =============================================================================
 
-class TestPreprocessorExecution(unittest.TestCase):
+class TestPreprocessorExecution(SharedTempDirTestCase):
     """Tests for running the actual preprocessor"""
 
     @classmethod
     def setUpClass(cls):
+        super().setUpClass()
         cls.compiler = find_compiler()
         cls.test_dir = Path(__file__).parent
         
@@ -107,11 +176,7 @@ class TestPreprocessorExecution(unittest.TestCase):
             self.skipTest("No C++ compiler available")
         
         # Create temp directory for test files
-        self.temp_dir = tempfile.mkdtemp(prefix='blcc_test_')
-    
-    def tearDown(self):
-        if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        super().setUp()
 
     def test_preprocess_simple_file(self):
         """Test preprocessing a simple file with no includes"""
@@ -126,6 +191,41 @@ class TestPreprocessorExecution(unittest.TestCase):
         # Should have line markers
         self.assertIn("# 1", stdout)
 
+    def test_preprocess_without_markers(self):
+        """markers=False gives the content alone"""
+        source = Path(self.temp_dir) / "simple.cpp"
+        source.write_text("int main() { return 0; }\n")
+        
+        success, stdout, stderr = run_preprocessor(self.compiler, str(source), markers=False)
+        
+        self.assertTrue(success, f"Preprocessor failed: {stderr}")
+        self.assertIn("int main()", stdout)
+        self.assertEqual(strip_line_markers(stdout), stdout)
+
+    def test_preprocess_binary_output(self):
+        """Undecoded output maps the same as the decoded text"""
+        source = Path(self.temp_dir) / "simple.cpp"
+        source.write_text("int main() { return 0; }\n")
+        
+        success, stdout, stderr = run_preprocessor(self.compiler, str(source))
+        self.assertTrue(success, f"Preprocessor failed: {stderr}")
+        success, raw, stderr = run_preprocessor(self.compiler, str(source), text=False)
+        self.assertTrue(success, f"Preprocessor failed: {stderr}")
+        
+        self.assertIsInstance(raw, bytes)
+        self.assertEqual(dict(build_line_map(raw)), dict(build_line_map(stdout)))
+
+    def test_stream_preprocessor_lines(self):
+        """Streamed output builds the same line map as the buffered output"""
+        source = Path(self.temp_dir) / "simple.cpp"
+        source.write_text("int main() { return 0; }\n")
+        
+        success, stdout, stderr = run_preprocessor(self.compiler, str(source))
+        self.assertTrue(success, f"Preprocessor failed: {stderr}")
+        
+        line_map = build_line_map_streaming(stream_preprocessor_lines(self.compiler, str(source)))
+        self.assertEqual(dict(line_map), dict(build_line_map(stdout)))
+
     def test_preprocess_with_local_include(self):
         """Test preprocessing a file that includes a local header"""
         # Create header
@@ -179,22 +279,19 @@ int main():
         self.assertIn("main.blcpp", stdout)
 
 
-class TestLineMapFromPreprocessor(unittest.TestCase):
+class TestLineMapFromPreprocessor(SharedTempDirTestCase):
     """Tests for building line maps from real preprocessor output"""
 
     @classmethod
     def setUpClass(cls):
+        super().setUpClass()
         cls.compiler = find_compiler()
         
     def setUp(self):
         if not self.compiler:
             self.skipTest("No C++ compiler available")
         
-        self.temp_dir = tempfile.mkdtemp(prefix='blcc_test_')
-    
-    def tearDown(self):
-        if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        super().setUp()
 
     def test_line_map_simple(self):
         """Build line map from simple preprocessor output"""
@@ -204,15 +301,11 @@ class TestLineMapFromPreprocessor(unittest.TestCase):
         success, stdout, _ = run_preprocessor(self.compiler, str(source))
         self.assertTrue(success)
         
-        line_map = build_line_map(stdout)
+        line_map, content = parse_preprocessor(stdout)
         
-        # Find lines that map to our source file
-        source_lines = [
-            (k, v) for k, v in line_map.items() 
-            if 'test.cpp' in v.file
-        ]
-        
-        self.assertGreater(len(source_lines), 0)
+        self.assertEqual(locate_content_line(line_map, content, "int x = 1;"), ("test.cpp", 1))
+        self.assertEqual(locate_content_line(line_map, content, "int y = 2;"), ("test.cpp", 2))
+        self.assertEqual(locate_content_line(line_map, content, "int z = 3;"), ("test.cpp", 3))
 
     def test_line_map_with_include(self):
         """Build line map from output with includes"""
@@ -227,21 +320,19 @@ class TestLineMapFromPreprocessor(unittest.TestCase):
         )
         self.assertTrue(success)
         
-        line_map = build_line_map(stdout)
+        line_map, content = parse_preprocessor(stdout)
         
         # Should have entries from both files
-        header_lines = [v for v in line_map.values() if 'header.h' in v.file]
-        main_lines = [v for v in line_map.values() if 'main.cpp' in v.file]
-        
-        self.assertGreater(len(header_lines), 0, "No lines from header.h")
-        self.assertGreater(len(main_lines), 0, "No lines from main.cpp")
+        self.assertEqual(locate_content_line(line_map, content, "int header_var = 1;"), ("header.h", 1))
+        self.assertEqual(locate_content_line(line_map, content, "int main_var = 2;"), ("main.cpp", 2))
 
 
-class TestEndToEndPipeline(unittest.TestCase):
+class TestEndToEndPipeline(SharedTempDirTestCase):
     """End-to-end tests for the complete preprocessing + transpilation pipeline"""
 
     @classmethod
     def setUpClass(cls):
+        super().setUpClass()
         cls.compiler = find_compiler()
         cls.test_dir = Path(__file__).parent
         
@@ -249,11 +340,7 @@ class TestEndToEndPipeline(unittest.TestCase):
         if not self.compiler:
             self.skipTest("No C++ compiler available")
         
-        self.temp_dir = tempfile.mkdtemp(prefix='blcc_test_')
-    
-    def tearDown(self):
-        if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
+        super().setUp()
 
     def test_full_pipeline_simple_include(self):
         """Test full pipeline with simple .blh include"""
@@ -281,31 +368,20 @@ int main():
         )
         self.assertTrue(success, f"Preprocessing failed: {stderr}")
         
-        # Step 2: Build line map
-        preproc_line_map = build_line_map(preproc_output)
-        
-        # Step 3: Strip line markers
-        stripped = strip_line_markers(preproc_output)
+        # Steps 2 and 3: Build line map and strip line markers, in one pass
+        preproc_line_map, stripped = parse_preprocessor(preproc_output)
         
         # Verify stripped content has braceless code
         self.assertIn("int add(int a, int b):", stripped)
         self.assertIn("return a + b", stripped)
         self.assertIn("int main():", stripped)
         
-        # Step 4: Verify line mappings
-        # Find a line from the header
-        header_lines = [
-            (k, v) for k, v in preproc_line_map.items()
-            if 'math.blh' in v.file
-        ]
-        self.assertGreater(len(header_lines), 0)
-        
-        # Find a line from main
-        main_lines = [
-            (k, v) for k, v in preproc_line_map.items()
-            if 'main.blcpp' in v.file
-        ]
-        self.assertGreater(len(main_lines), 0)
+        # Step 4: Verify line mappings, for lines from the header and from main
+        for text, expected in (("int add(int a, int b):", ("math.blh", 3)),
+                               ("return a + b", ("math.blh", 4)),
+                               ("int main():", ("main.blcpp", 3)),
+                               ("return add(1, 2)", ("main.blcpp", 4))):
+            self.assertEqual(locate_content_line(preproc_line_map, stripped, text), expected)
 
     def test_error_mapping_simulation(self):
         """Simulate error mapping through the pipeline"""
@@ -332,26 +408,41 @@ int main():
         )
         self.assertTrue(success)
         
-        # Build line map
-        preproc_line_map = build_line_map(preproc_output)
+        # Build line map and strip the markers
+        preproc_line_map, stripped = parse_preprocessor(preproc_output)
         
         # Simulate transpilation (1:1 for simplicity)
-        stripped = strip_line_markers(preproc_output)
         stripped_lines = stripped.split('\n')
         
         # Create chained mapping: transpiled_line -> SourceLocation
         # In real impl, this would chain transpile_map with preproc_line_map
         chained_map = preproc_line_map  # Simplified for test
         
-        # Simulate an error at a line from the header
-        # Find which output line corresponds to "return  // Missing value"
-        for output_line, loc in chained_map.items():
-            if 'utils.blh' in loc.file and loc.line == 4:
-                # This is where the error would be
-                # Verify we can map back correctly
-                self.assertEqual(loc.file, str(header).replace('\\', '/').split('/')[-1] 
-                               if '/' in str(header) else header.name)
-                break
+        # Simulate an error at a line from the header: "return  // Missing value"
+        # (the preprocessor drops the comment) must map back to utils.blh:4
+        self.assertEqual(locate_content_line(chained_map, stripped, "return"), (header.name, 4))
+
+
+# The real test case directories used below, and their preprocessor results
+# (success, output, stderr), filled once per run by setUpModule
+REAL_CASES = ("01_simple_include", "02_nested_includes", "03_mixed_headers")
+_REAL_CASE_RESULTS: Dict[str, Tuple[bool, str, str]] = {}
+
+
+def setUpModule():
+    """Preprocess every real test case at once; the compiler runs overlap in threads"""
+    compiler = find_compiler()
+    if not compiler:
+        return
+    test_dir = Path(__file__).parent
+    cases = [name for name in REAL_CASES if (test_dir / name / "main.blcpp").is_file()]
+    
+    def preprocess(name: str) -> Tuple[str, Tuple[bool, str, str]]:
+        case_dir = test_dir / name
+        return name, run_preprocessor(compiler, str(case_dir / "main.blcpp"), [str(case_dir)])
+    
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        _REAL_CASE_RESULTS.update(executor.map(preprocess, cases))
 
 
 class TestWithRealTestCases(unittest.TestCase):
@@ -361,6 +452,11 @@ class TestWithRealTestCases(unittest.TestCase):
     def setUpClass(cls):
         cls.compiler = find_compiler()
         cls.test_dir = Path(__file__).parent
+        # Look the case directories up once, instead of probing them in every test
+        with os.scandir(cls.test_dir) as it:
+            cls._case_dirs = {entry.name for entry in it if entry.is_dir()}
+        cls._valid_cases = {name for name in cls._case_dirs
+                            if (cls.test_dir / name / "main.blcpp").is_file()}
         
     def setUp(self):
         if not self.compiler:
@@ -368,27 +464,25 @@ class TestWithRealTestCases(unittest.TestCase):
 
     def _test_case(self, case_name: str):
         """Helper to test a specific test case directory"""
-        case_dir = self.test_dir / case_name
-        if not case_dir.exists():
+        if case_name not in self._case_dirs:
             self.skipTest(f"Test case {case_name} not found")
-        
-        main_file = case_dir / "main.blcpp"
-        if not main_file.exists():
+        if case_name not in self._valid_cases:
             self.skipTest(f"main.blcpp not found in {case_name}")
         
-        # Preprocess
-        success, preproc_output, stderr = run_preprocessor(
-            self.compiler, str(main_file), [str(case_dir)]
-        )
+        # Preprocess (normally already done by setUpModule)
+        result = _REAL_CASE_RESULTS.get(case_name)
+        if result is None:
+            case_dir = self.test_dir / case_name
+            result = run_preprocessor(self.compiler, str(case_dir / "main.blcpp"), [str(case_dir)])
+        success, preproc_output, stderr = result
         
         self.assertTrue(success, f"Preprocessing failed for {case_name}: {stderr}")
         
-        # Build line map
-        line_map = build_line_map(preproc_output)
+        # Build line map and strip the markers
+        line_map, stripped = parse_preprocessor(preproc_output)
         self.assertGreater(len(line_map), 0, f"Empty line map for {case_name}")
         
-        # Strip and verify content
-        stripped = strip_line_markers(preproc_output)
+        # Verify content
         self.assertGreater(len(stripped), 0, f"Empty stripped content for {case_name}")
         
         return preproc_output, line_map, stripped
@@ -14,7 +14,9 @@ import unittest
 import sys
 import os
 import re
-from typing import Dict, Tuple, List, Optional
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Tuple, List, Optional, Iterator, Iterable, NamedTuple, Union
 from dataclasses import dataclass
 
 # Add parent directory to path to import blcc
@@ -25,8 +27,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 # Data structures (to be moved to blcc.py)
 # =============================================================================
 
-@dataclass
-class SourceLocation:
+class SourceLocation(NamedTuple):
     """Represents a location in a source file"""
     file: str
     line: int
@@ -55,6 +56,98 @@ class LineMarker:
         return 3 in self.flags
 
 
+class LineMap(Mapping):
+    """Mapping from output line number -> SourceLocation, stored as parallel arrays.
+    
+    file_ids[n] and lines[n] hold the source location of output line n (index
+    0 is unused); file_ids index the filenames table. File id 0 (filename
+    None) marks output lines with no known source file. SourceLocation
+    objects are only created when an entry is looked up. For queries by
+    file, the output lines of each file are also kept as [start, count] runs.
+    """
+    __slots__ = ('file_ids', 'lines', 'filenames', '_file_ids_by_name', '_runs_by_file', '_count')
+    
+    def __init__(self):
+        self.file_ids = array('I', [0])
+        self.lines = array('i', [0])
+        self.filenames: List[Optional[str]] = [None]
+        self._file_ids_by_name: Dict[Optional[str], int] = {None: 0}
+        self._runs_by_file: Dict[int, List[List[int]]] = {}
+        self._count = 0
+    
+    def _file_id(self, file: Optional[str]) -> int:
+        file_id = self._file_ids_by_name.get(file)
+        if file_id is None:
+            file_id = self._file_ids_by_name[file] = len(self.filenames)
+            self.filenames.append(file)
+        return file_id
+    
+    def _add_run(self, file_id: int, start: int, count: int):
+        runs = self._runs_by_file.setdefault(file_id, [])
+        if runs and runs[-1][0] + runs[-1][1] == start:
+            runs[-1][1] += count
+        else:
+            runs.append([start, count])
+    
+    def append(self, file: Optional[str], line: int):
+        """Add the location of the next output line"""
+        file_id = self._file_id(file)
+        self.file_ids.append(file_id)
+        self.lines.append(line if file is not None else 0)
+        if file is not None:
+            self._add_run(file_id, len(self.file_ids) - 1, 1)
+            self._count += 1
+    
+    def extend(self, file: Optional[str], first_line: int, count: int):
+        """Add count consecutive output lines starting at source line first_line"""
+        if count <= 0:
+            return
+        file_id = self._file_id(file)
+        start = len(self.file_ids)
+        self.file_ids.extend(array('I', [file_id]) * count)
+        if file is not None:
+            self.lines.extend(range(first_line, first_line + count))
+            self._add_run(file_id, start, count)
+            self._count += count
+        else:
+            self.lines.extend(array('i', [0]) * count)
+    
+    def items_from(self, file_substr: str) -> List[Tuple[int, SourceLocation]]:
+        """(output_line, location) of every line from a file whose name contains file_substr"""
+        file_ids = [file_id for file_id, name in enumerate(self.filenames)
+                    if name is not None and file_substr in name]
+        runs = [(start, count, file_id) for file_id in file_ids
+                for start, count in self._runs_by_file.get(file_id, ())]
+        if len(file_ids) > 1:
+            runs.sort()
+        filenames = self.filenames
+        lines = self.lines
+        return [(n, SourceLocation(filenames[file_id], lines[n]))
+                for start, count, file_id in runs for n in range(start, start + count)]
+    
+    def lines_from(self, file_substr: str) -> List[SourceLocation]:
+        """Locations of every line from a file whose name contains file_substr"""
+        return [location for _, location in self.items_from(file_substr)]
+    
+    def __getitem__(self, output_line: int) -> SourceLocation:
+        if 0 < output_line < len(self.file_ids):
+            file_id = self.file_ids[output_line]
+            if file_id:
+                return SourceLocation(self.filenames[file_id], self.lines[output_line])
+        raise KeyError(output_line)
+    
+    def __contains__(self, output_line) -> bool:
+        return (isinstance(output_line, int) and 0 < output_line < len(self.file_ids)
+                and self.file_ids[output_line] != 0)
+    
+    def __iter__(self) -> Iterator[int]:
+        file_ids = self.file_ids
+        return (n for n in range(1, len(file_ids)) if file_ids[n])
+    
+    def __len__(self) -> int:
+        return self._count
+
+
 # =============================================================================
 # Reference implementations for testing
 # =============================================================================
@@ -70,6 +163,17 @@ LINE_MARKER_PATTERN = re.compile(
     r'^#\s+(\d+)\s+"([^"]+)"(?:\s+(.*))?$'
 )
 
+# The same marker as a whole line of a multi-line buffer, surrounding
+# whitespace and the trailing newline included, so markers can be found
+# (and removed) by one scan of the preprocessor output
+LINE_MARKER_LINE_PATTERN = re.compile(
+    r'^[^\S\n]*#[^\S\n]+(\d+)[^\S\n]+"([^"\n]+)"(?:[^\S\n][^\n]*)?$\n?',
+    re.MULTILINE
+)
+
+# The same, for undecoded preprocessor output
+LINE_MARKER_LINE_PATTERN_BYTES = re.compile(LINE_MARKER_LINE_PATTERN.pattern.encode(), re.MULTILINE)
+
 
 def parse_line_marker(line: str) -> Optional[LineMarker]:
     """Parse a preprocessor line marker.
@@ -95,52 +199,125 @@ def parse_line_marker(line: str) -> Optional[LineMarker]:
     return LineMarker(line_num, filename, flags)
 
 
-def build_line_map(preprocessor_output: str) -> Dict[int, SourceLocation]:
-    """Build a mapping from output line numbers to source locations.
+def parse_preprocessor(preprocessor_output: Union[str, bytes]) -> Tuple[LineMap, Union[str, bytes]]:
+    """Build the line map and strip the line markers in one scan of the output.
     
     Args:
-        preprocessor_output: The output from running cpp/clang -E
+        preprocessor_output: The output from running cpp/clang -E. Undecoded
+            bytes are scanned as they are; only marker filenames are decoded.
         
     Returns:
-        Dict mapping output line number -> SourceLocation(file, line)
+        (line_map, content): the build_line_map and strip_line_markers results;
+        content has the same type as preprocessor_output
     """
-    line_map = {}
+    if isinstance(preprocessor_output, bytes):
+        pattern, newline, decode = LINE_MARKER_LINE_PATTERN_BYTES, b'\n', os.fsdecode
+    else:
+        pattern, newline, decode = LINE_MARKER_LINE_PATTERN, '\n', str
+    
+    line_map = LineMap()
+    content = []
     current_file = None
     current_line = 1
-    output_line = 0
     
-    for line in preprocessor_output.split('\n'):
-        marker = parse_line_marker(line)
+    # Content lines between two markers form one run of consecutive source lines
+    pos = 0
+    for marker in pattern.finditer(preprocessor_output):
+        start = marker.start()
+        line_map.extend(current_file, current_line, preprocessor_output.count(newline, pos, start))
+        content.append(preprocessor_output[pos:start])
+        # The same file comes back after every include, so share one string per filename
+        current_file = sys.intern(decode(marker.group(2)))
+        current_line = int(marker.group(1))
+        pos = marker.end()
+    
+    # Everything after the last marker is content, unless the output ends with a
+    # marker that has no trailing newline
+    if pos == 0 or preprocessor_output[pos - 1:pos] == newline:
+        line_map.extend(current_file, current_line, preprocessor_output.count(newline, pos) + 1)
+        content.append(preprocessor_output[pos:])
+        return line_map, newline[:0].join(content)
+    # Such a final marker also takes the newline of the line before it
+    return line_map, newline[:0].join(content)[:-1]
+
+
+def build_line_map(preprocessor_output: Union[str, bytes]) -> LineMap:
+    """Build a mapping from output line numbers to source locations.
+    
+    Args:
+        preprocessor_output: The output from running cpp/clang -E, as str or bytes
+        
+    Returns:
+        LineMap mapping output line number -> SourceLocation(file, line)
+    """
+    return parse_preprocessor(preprocessor_output)[0]
+
+
+def build_line_map_streaming(lines: Iterable[str]) -> LineMap:
+    """Build the same map as build_line_map, from lines as they arrive.
+    
+    Args:
+        lines: Preprocessor output one line at a time, each with its newline
+            (as read from a pipe), so parsing overlaps the preprocessor run
         
+    Returns:
+        LineMap mapping output line number -> SourceLocation(file, line)
+    """
+    line_map = LineMap()
+    current_file = None
+    current_line = 1
+    ends_with_newline = True
+    
+    for line in lines:
+        ends_with_newline = line.endswith('\n')
+        # Skip the call entirely for the many lines without a '#' at all
+        marker = parse_line_marker(line) if '#' in line else None
         if marker:
-            # Update current file and line from marker
             current_file = marker.filename
             current_line = marker.line_num
-            # Line markers don't produce output, so don't increment output_line
         else:
-            # This is a content line
-            output_line += 1
-            if current_file:
-                line_map[output_line] = SourceLocation(current_file, current_line)
+            line_map.append(current_file, current_line)
             current_line += 1
     
+    # Like split('\n'), count the empty line after a final newline
+    if ends_with_newline:
+        line_map.append(current_file, current_line)
+    
     return line_map
 
 
-def strip_line_markers(preprocessor_output: str) -> str:
+def strip_line_markers(preprocessor_output: Union[str, bytes]) -> Union[str, bytes]:
     """Remove line markers from preprocessor output, keeping only content.
     
     Args:
-        preprocessor_output: The output from running cpp/clang -E
+        preprocessor_output: The output from running cpp/clang -E, as str or bytes
         
     Returns:
-        The content with line markers removed
+        The content with line markers removed, of the same type as the output
     """
-    lines = []
-    for line in preprocessor_output.split('\n'):
-        if not parse_line_marker(line):
-            lines.append(line)
-    return '\n'.join(lines)
+    return parse_preprocessor(preprocessor_output)[1]
+
+
+def compose_line_maps(
+    transpile_map: Mapping,
+    preproc_map: Mapping
+) -> Dict[int, SourceLocation]:
+    """Chain transpiled line -> preprocessed line -> source location up front.
+    
+    Args:
+        transpile_map: Mapping from transpiled line -> preprocessed line
+        preproc_map: Mapping from preprocessed line -> SourceLocation
+        
+    Returns:
+        Dict from transpiled line -> SourceLocation, so each diagnostic is
+        resolved with one lookup; lines with no location are left out
+    """
+    composed = {}
+    for transpiled_line, preproc_line in transpile_map.items():
+        location = preproc_map.get(preproc_line)
+        if location is not None:
+            composed[transpiled_line] = location
+    return composed
 
 
 # =============================================================================
@@ -381,6 +558,35 @@ int y = 2'''
         self.assertEqual(line_map[2].line, 2)  # empty line
         self.assertEqual(line_map[3].line, 3)  # int y = 2
 
+    def test_streaming_matches_whole_output(self):
+        """build_line_map_streaming gives the same map as build_line_map"""
+        for preprocessor_output in (
+            '',
+            '# 1 "main.blcpp"\nint x\n# 1 "header.blh" 1\nint y\n\n# 2 "main.blcpp" 2\nint z\n',
+            'int a\n# 7 "main.blcpp"\nint b',
+        ):
+            expected = build_line_map(preprocessor_output)
+            streamed = build_line_map_streaming(preprocessor_output.splitlines(keepends=True))
+            self.assertEqual(dict(streamed), dict(expected))
+            self.assertEqual(streamed.file_ids, expected.file_ids)
+            self.assertEqual(streamed.lines, expected.lines)
+
+    def test_many_files(self):
+        """File ids go past 16 bits"""
+        line_map = LineMap()
+        for i in range(70000):
+            line_map.append(f'h{i}.blh', 1)
+        self.assertEqual(line_map[70000], SourceLocation('h69999.blh', 1))
+
+    def test_maps_are_not_shared(self):
+        """Changing a returned map doesn't change the next result for the same output"""
+        preprocessor_output = '# 1 "main.blcpp"\nint x\n'
+        line_map = build_line_map(preprocessor_output)
+        line_map.append('other.blh', 9)
+        fresh = build_line_map(preprocessor_output)
+        self.assertEqual(dict(fresh), {1: SourceLocation('main.blcpp', 1), 2: SourceLocation('main.blcpp', 2)})
+        self.assertEqual(fresh.lines_from('other'), [])
+
 
 class TestStripLineMarkers(unittest.TestCase):
     """Tests for strip_line_markers function"""
@@ -431,6 +637,18 @@ int x = FOO
         self.assertIn('#pragma once', result)
         self.assertIn('#define FOO 1', result)
 
+    def test_strip_bytes_output(self):
+        """Undecoded output is stripped to bytes and mapped like the decoded text"""
+        preprocessor_output = '# 1 "main.blcpp"\n# 1 "h\u00e9ader.blh" 1\nint x;\n# 2 "main.blcpp" 2\nint y;\n'
+        raw = preprocessor_output.encode()
+        self.assertEqual(strip_line_markers(raw), strip_line_markers(preprocessor_output).encode())
+        self.assertEqual(dict(build_line_map(raw)), dict(build_line_map(preprocessor_output)))
+
+    def test_strip_trailing_marker_without_newline(self):
+        """A marker on the last line is removed along with the line break before it"""
+        preprocessor_output = 'int x;\n# 2 "main.blcpp" 2'
+        self.assertEqual(strip_line_markers(preprocessor_output), 'int x;')
+
 
 class TestChainedMapping(unittest.TestCase):
     """Tests for chaining preprocessor map with transpile map"""
@@ -474,6 +692,17 @@ class TestChainedMapping(unittest.TestCase):
         loc = chain_lookup(5)
         self.assertEqual(loc.file, "main.blcpp")
         self.assertEqual(loc.line, 4)
+        
+        # The precomposed map gives the same answers with a single lookup
+        composed = compose_line_maps(transpile_map, preproc_map)
+        for transpiled_line in range(0, 8):
+            self.assertEqual(composed.get(transpiled_line), chain_lookup(transpiled_line))
+
+    def test_compose_skips_unmapped_lines(self):
+        """Lines whose preprocessed line has no location are left out"""
+        preproc_map = build_line_map('# 1 "main.blcpp"\nint x;\n')
+        composed = compose_line_maps({1: 1, 2: 5}, preproc_map)
+        self.assertEqual(composed, {1: SourceLocation("main.blcpp", 1)})
 
 
 class TestErrorPatching(unittest.TestCase):
@@ -586,9 +815,10 @@ class TestRealisticScenarios(unittest.TestCase):
         self.assertEqual(line_map[1].file, "./math_utils.blh")
         self.assertEqual(line_map[1].line, 1)  # // Simple math utilities header
         
-        # Find where main.blcpp content starts
-        main_lines = [(k, v) for k, v in line_map.items() if 'main.blcpp' in v.file]
-        self.assertTrue(len(main_lines) > 0)
+        # main.blcpp resumes at its line 2 right after the header's 23 lines
+        main_lines = line_map.items_from('main.blcpp')
+        self.assertEqual(main_lines, [(24 + i, SourceLocation("main.blcpp", 2 + i)) for i in range(11)])
+        self.assertEqual(line_map[25], SourceLocation("main.blcpp", 3))  # int main():
 
     def test_strip_realistic_output(self):
         """Test stripping markers from realistic output"""
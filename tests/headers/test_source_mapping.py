@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Tests for the run-length encoded line mappings in braceless.py.
+
+These tests verify that:
+1. TrackedOutputList starts, merges and drops runs as its source line changes
+2. SourceRuns locates expanded lines across run boundaries
+3. SourceMapping indexes like a sequence of (file, line) and handles lines past the end
+"""
+
+import unittest
+import sys
+import os
+import io
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from braceless import (
+    TrackedOutputList, SourceRuns, SourceMapping, Compiler,
+    transpile_to_stream, _get_source_location
+)
+from support import SharedTempDirTestCase
+
+
+class TestTrackedOutputList(unittest.TestCase):
+    """Tests for TrackedOutputList runs"""
+
+    def test_runs_follow_source_line(self):
+        """Consecutive items from one source line form one run"""
+        output = TrackedOutputList()
+        output.append('a')
+        output.append('b')
+        output.current_source_line = 3
+        output.append('c')
+        self.assertEqual(output.source_runs(), [(2, 1), (1, 3)])
+        self.assertEqual(output.source_lines, [1, 1, 3])
+
+    def test_empty_run_is_replaced(self):
+        """A source line that emitted nothing leaves no run behind"""
+        output = TrackedOutputList()
+        output.append('a')
+        output.current_source_line = 2
+        output.current_source_line = 5
+        output.append('b')
+        self.assertEqual(output.source_runs(), [(1, 1), (1, 5)])
+
+    def test_return_to_previous_line_extends_its_run(self):
+        """Switching away and back without output continues the earlier run"""
+        output = TrackedOutputList()
+        output.append('a')
+        output.current_source_line = 2
+        output.current_source_line = 1
+        output.append('b')
+        self.assertEqual(output.source_runs(), [(2, 1)])
+
+    def test_pop_shifts_later_runs(self):
+        """Popping an item shortens its run and moves later runs back"""
+        output = TrackedOutputList()
+        output.extend(['a', 'b'])
+        output.current_source_line = 4
+        output.extend(['c', 'd'])
+        output.pop(1)
+        self.assertEqual(output.source_runs(), [(1, 1), (2, 4)])
+        self.assertEqual([output.get_source_line(i) for i in (1, 2, 3)], [1, 4, 4])
+
+    def test_get_source_line_past_end(self):
+        """Lines past the output map to themselves"""
+        output = TrackedOutputList()
+        output.append('a')
+        self.assertEqual(output.get_source_line(7), 7)
+
+    def test_compiler_runs_cover_output(self):
+        """The compiler's runs cover each output line once and agree with lookups"""
+        compiler = Compiler('int f():\n    return 1\n\nint main():\n    if 1:\n        return 0\n    return f()\n')
+        compiler.compile()
+        output = compiler.output
+        self.assertEqual(sum(count for count, _ in output.source_runs()), len(output))
+        self.assertEqual(output.source_lines,
+                         [output.get_source_line(i + 1) for i in range(len(output))])
+        self.assertEqual(output.source_lines[0], 1)
+        self.assertEqual(output.source_lines[-1], 7)
+
+
+class TestSourceRuns(unittest.TestCase):
+    """Tests for SourceRuns"""
+
+    def setUp(self):
+        # main.blcpp line 1, then h.blh lines 1-3, then main.blcpp from line 3 on
+        self.runs = SourceRuns()
+        self.runs.add(0, 'main.blcpp', 1)
+        self.runs.add(1, 'h.blh', 1)
+        self.runs.add(4, 'main.blcpp', 3)
+
+    def test_locate_across_boundaries(self):
+        """Each expanded line maps into the run that contains it"""
+        self.assertEqual([self.runs.locate(i) for i in range(6)], [
+            ('main.blcpp', 1), ('h.blh', 1), ('h.blh', 2), ('h.blh', 3),
+            ('main.blcpp', 3), ('main.blcpp', 4),
+        ])
+
+    def test_continuing_run_is_merged(self):
+        """Adding the next line of the same file doesn't start a run"""
+        self.runs.add(6, 'main.blcpp', 5)
+        self.assertEqual(len(self.runs.starts), 3)
+        self.assertEqual(self.runs.locate(6), ('main.blcpp', 5))
+
+    def test_empty_run_is_replaced(self):
+        """A run that gets no lines is overwritten by the next one"""
+        self.runs.add(6, 'empty.blh', 1)
+        self.runs.add(6, 'main.blcpp', 9)
+        self.assertEqual(len(self.runs.starts), 4)
+        self.assertEqual(self.runs.locate(6), ('main.blcpp', 9))
+
+    def test_files_are_stored_once(self):
+        """A file seen in several runs has one entry in files"""
+        self.assertEqual(self.runs.files, ['main.blcpp', 'h.blh'])
+
+    def test_runs_between(self):
+        """runs_between gives the runs of a slice, relative to its start"""
+        self.assertEqual(self.runs.runs_between(2, 5), [(0, 'h.blh', 2), (2, 'main.blcpp', 3)])
+        self.assertEqual(self.runs.runs_between(3, 3), [])
+
+
+class TestSourceMapping(unittest.TestCase):
+    """Tests for SourceMapping"""
+
+    def setUp(self):
+        source_runs = SourceRuns()
+        source_runs.add(0, 'main.blcpp', 1)
+        source_runs.add(1, 'h.blh', 1)
+        # Output lines 1-2 come from expanded line 1, line 3 from expanded line 2,
+        # and line 4 from an expanded line that doesn't exist
+        self.mapping = SourceMapping([(2, 1), (1, 2), (1, 9)], source_runs, 2)
+
+    def test_len(self):
+        self.assertEqual(len(self.mapping), 4)
+
+    def test_getitem(self):
+        """Indices are 0-based output lines"""
+        self.assertEqual(self.mapping[0], ('main.blcpp', 1))
+        self.assertEqual(self.mapping[1], ('main.blcpp', 1))
+        self.assertEqual(self.mapping[2], ('h.blh', 1))
+        self.assertEqual(self.mapping[-2], ('h.blh', 1))
+
+    def test_expanded_line_out_of_range(self):
+        """An output line attributed past the expanded text maps to <unknown>"""
+        self.assertEqual(self.mapping[3], ('<unknown>', 9))
+
+    def test_index_past_end(self):
+        with self.assertRaises(IndexError):
+            self.mapping[4]
+        with self.assertRaises(IndexError):
+            self.mapping[-5]
+
+    def test_lines_past_last_run(self):
+        """Diagnostics on lines past the output keep their line number"""
+        self.assertEqual(_get_source_location(self.mapping, 5), ('<unknown>', 5))
+        self.assertEqual(_get_source_location(self.mapping, 0), ('<unknown>', 0))
+
+    def test_empty_mapping(self):
+        mapping = SourceMapping([], SourceRuns(), 0)
+        self.assertEqual(len(mapping), 0)
+        self.assertEqual(list(mapping), [])
+
+
+class TestTranspiledMapping(SharedTempDirTestCase):
+    """Tests for the mapping transpile_to_stream returns"""
+
+    def test_header_and_source_lines(self):
+        """Output lines map to the header and source lines they came from"""
+        header = self.write('util.blh', 'int add(int a, int b):\n    return a + b\n')
+        source = self.write('main.blcpp', '#include "util.blh"\n\nint main():\n    return add(1, 2)\n')
+        stream = io.StringIO()
+        mapping = transpile_to_stream(source, stream)
+        lines = stream.getvalue().split('\n')
+        self.assertEqual(len(mapping), len(lines) - 1)
+        self.assertEqual(mapping[lines.index('    return a + b;')], (header, 2))
+        self.assertEqual(mapping[lines.index('int main() {')], (source, 3))
+        self.assertEqual(mapping[lines.index('    return add(1, 2);')], (source, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for braceless.py used as a compiler wrapper (braceless g++ ...).
+
+These tests verify that:
+1. --pipe maps diagnostics back to the original file and line
+2. --pipe falls back to a temp file when there is no -o
+3. Commands without .blcpp sources run the compiler unchanged
+4. Several sources, even with the same name, are transpiled and mapped apart
+"""
+
+import unittest
+import sys
+import os
+import re
+import subprocess
+import shutil
+
+BRACELESS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                         'braceless.py')
+
+from support import SharedTempDirTestCase
+
+COMPILER = shutil.which('g++')
+
+
+def run_wrapper(*args: str, cwd: str = None) -> subprocess.CompletedProcess:
+    """Run braceless.py as a wrapper around g++"""
+    return subprocess.run([sys.executable, BRACELESS, 'g++', *args], cwd=cwd,
+                          capture_output=True, text=True, timeout=120)
+
+
+@unittest.skipUnless(COMPILER, "g++ not available")
+class WrapperTestCase(SharedTempDirTestCase):
+    """Base for wrapper tests: a temp dir holding the sources and outputs"""
+
+
+@unittest.skipUnless(os.name == 'posix', "--pipe needs /dev/fd")
+class TestPipeSource(WrapperTestCase):
+    """Tests for --pipe"""
+
+    def setUp(self):
+        super().setUp()
+        self.write('util.blh', 'int add(int a, int b):\n    return a + b + undefined_var\n')
+        self.source = self.write('main.blcpp', '#include "util.blh"\n\nint main():\n    return add(1, 2)\n')
+
+    def test_pipe_maps_error_to_header(self):
+        """An error in the piped source is reported at its .blh file and line"""
+        result = run_wrapper('--pipe', '-c', self.source, '-o', os.path.join(self.temp_dir, 'main.o'))
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('/dev/fd/', result.stderr)
+        self.assertRegex(result.stderr, r'util\.blh:2:\d+: error: .*undefined_var')
+
+    def test_pipe_without_output_uses_temp_file(self):
+        """Without -o the source is written to a temp file and errors still map"""
+        result = run_wrapper('--pipe', '--verbose', '-c', self.source, cwd=self.temp_dir)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('Temp directory', result.stderr)
+        self.assertNotIn('/dev/fd/', result.stderr)
+        self.assertRegex(result.stderr, r'util\.blh:2:\d+: error: .*undefined_var')
+
+
+class TestPassThrough(WrapperTestCase):
+    """Tests for commands with no .blcpp sources"""
+
+    def assert_same_as_compiler(self, *args: str):
+        direct = subprocess.run([COMPILER, *args], cwd=self.temp_dir,
+                                capture_output=True, text=True, timeout=120)
+        wrapped = run_wrapper(*args, cwd=self.temp_dir)
+        self.assertEqual(wrapped.returncode, direct.returncode)
+        self.assertEqual(wrapped.stdout, direct.stdout)
+        self.assertEqual(wrapped.stderr, direct.stderr)
+        return wrapped
+
+    def test_failed_compile_keeps_status_and_stderr(self):
+        """A failing compile exits with the compiler's status and prints its errors"""
+        self.write('bad.cpp', 'int main() { return undefined_var; }\n')
+        result = self.assert_same_as_compiler('-c', 'bad.cpp', '-o', 'bad.o')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('bad.cpp:1:', result.stderr)
+
+    def test_stdout_is_kept(self):
+        """Output the compiler writes to stdout comes through unchanged"""
+        self.write('ok.cpp', '#define VALUE 42\nint value = VALUE;\n')
+        result = self.assert_same_as_compiler('-E', '-P', 'ok.cpp')
+        self.assertEqual(result.returncode, 0)
+        self.assertIn('int value = 42;', result.stdout)
+
+
+class TestMultipleSources(WrapperTestCase):
+    """Tests for commands with more than one .blcpp source"""
+
+    def test_same_name_in_different_directories(self):
+        """Two main.blcpp files get their own temp files and link together"""
+        self.write('a/main.blcpp', 'int helper():\n    return 3\n')
+        self.write('b/main.blcpp', 'int helper()\n\nint main():\n    return helper() + 4\n')
+        result = run_wrapper(os.path.join('a', 'main.blcpp'), os.path.join('b', 'main.blcpp'),
+                             '-o', 'prog', cwd=self.temp_dir)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        program = subprocess.run([os.path.join(self.temp_dir, 'prog')], timeout=60)
+        self.assertEqual(program.returncode, 7)
+
+    def test_errors_map_to_each_source(self):
+        """Errors in two same-named sources are reported at their own file and line"""
+        self.write('a/main.blcpp', 'int helper():\n    return bad_a\n')
+        self.write('b/main.blcpp', 'int helper()\n\nint main():\n    return bad_b\n')
+        result = run_wrapper('-c', os.path.join('a', 'main.blcpp'), os.path.join('b', 'main.blcpp'),
+                             cwd=self.temp_dir)
+        self.assertNotEqual(result.returncode, 0)
+        a_main = re.escape(os.path.join('a', 'main.blcpp'))
+        b_main = re.escape(os.path.join('b', 'main.blcpp'))
+        self.assertRegex(result.stderr, a_main + r':2:\d+: error: .*bad_a')
+        self.assertRegex(result.stderr, b_main + r':4:\d+: error: .*bad_b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,15 @@
+// Test: Braced control statements whose condition is only partially parenthesized
+
+bool both(bool a, bool b) {
+    if ((a) && (b)) {
+        return true;
+    }
+    while ((a) || (b)) {
+        a = false;
+        b = false;
+    }
+    if (a && b) {
+        return true;
+    }
+    return false;
+}
@@ -0,0 +1,22 @@
+// Test: Braced control statements whose partially parenthesized condition spans lines
+
+int f(int a) {
+    return a;
+}
+
+bool g(int b) {
+    return b > 0;
+}
+
+int check(int a, int b) {
+    if ((f(a) > 0) &&
+        g(b)) {
+        return 1;
+    }
+    while ((f(a) < 10) ||
+          (f(b) < 10)) { // keep counting
+        a = a + 1;
+        b = b + 1;
+    }
+    return 0;
+}
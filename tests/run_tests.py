@@ -6,12 +6,15 @@ This script runs all test cases and verifies that blcc produces the expected out
 Each test consists of a .blcpp file (input) and a .cpp file (expected output).
 """
 
+import locale
 import os
 import subprocess
 import sys
 from pathlib import Path
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 import difflib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 
 class Colors:
     GREEN = '\033[92m'
@@ -21,14 +24,34 @@ class Colors:
     RESET = '\033[0m'
     BOLD = '\033[1m'
 
+# Extra blcc arguments: BLCC_CACHE_DIR=<dir> lets blcc reuse transpiled output
+# from earlier runs (the cache is keyed on blcc's own source, so edits to blcc
+# still get tested)
+BLCC_ARGS = [f"--cache-dir={os.environ['BLCC_CACHE_DIR']}"] if os.environ.get('BLCC_CACHE_DIR') else []
+
 def find_test_pairs(test_dir: Path) -> List[Tuple[Path, Path]]:
     """Find all test pairs (.blcpp and .cpp files) in the test directory."""
     test_pairs = []
     
-    for blcpp_file in test_dir.rglob("*.blcpp"):
-        cpp_file = blcpp_file.with_suffix(".cpp")
-        if cpp_file.exists():
-            test_pairs.append((blcpp_file, cpp_file))
+    # One scandir walk sees both halves of every pair, so no per-file stat is needed
+    blcpp_files = []
+    cpp_files = set()
+    dirs = [str(test_dir)]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.name.endswith(".blcpp"):
+                    blcpp_files.append(entry.path)
+                elif entry.name.endswith(".cpp"):
+                    cpp_files.add(entry.path)
+    
+    for blcpp_path in sorted(blcpp_files):
+        blcpp_file = Path(blcpp_path)
+        cpp_path = blcpp_path[:-len(".blcpp")] + ".cpp"
+        if cpp_path in cpp_files:
+            test_pairs.append((blcpp_file, Path(cpp_path)))
         else:
             print(f"{Colors.YELLOW}Warning: No matching .cpp file for {blcpp_file}{Colors.RESET}")
     
@@ -41,7 +64,7 @@ def run_blcc(blcc_path: str, input_file: Path) -> Tuple[bool, str, str]:
     """
     try:
         result = subprocess.run(
-            [sys.executable, blcc_path, str(input_file)],
+            [sys.executable, blcc_path, str(input_file), *BLCC_ARGS],
             capture_output=True,
             text=True,
             timeout=10
@@ -54,6 +77,52 @@ def run_blcc(blcc_path: str, input_file: Path) -> Tuple[bool, str, str]:
     except Exception as e:
         return (False, "", f"Error running blcc: {str(e)}")
 
+def decode_output(data: bytes) -> str:
+    """
+    Decode a child's output the way subprocess.run(text=True) does
+    """
+    text = data.decode(locale.getpreferredencoding(False))
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def run_blcc_batch(blcc_path: str, input_files: List[Path]) -> Optional[List[Tuple[bool, str, str]]]:
+    """
+    Run one blcc process over several input files (blcc --batch).
+    Returns: (success, stdout, stderr) per input file, as run_blcc would,
+    or None if the batch did not complete
+    """
+    try:
+        result = subprocess.run(
+            [sys.executable, blcc_path, '--batch', *BLCC_ARGS],
+            input=''.join(f"{input_file}\n" for input_file in input_files).encode(locale.getpreferredencoding(False)),
+            capture_output=True,
+            timeout=10 * len(input_files)
+        )
+    except Exception:
+        return None
+    if result.returncode != 0:
+        return None
+    
+    # Each file's record: a '---FILE <status> <stdout bytes> <stderr bytes> <name>'
+    # header line, then its stdout and stderr. The output is read undecoded, so
+    # the byte lengths stay valid whatever newlines and characters it holds
+    results = []
+    output = result.stdout
+    pos = 0
+    for input_file in input_files:
+        header_end = output.find(b'\n', pos)
+        header = output[pos:header_end].decode(locale.getpreferredencoding(False)).split(' ', 4)
+        if header_end < 0 or len(header) < 5 or header[0] != '---FILE' or header[4] != str(input_file):
+            return None
+        status, stdout_len, stderr_len = (int(field) for field in header[1:4])
+        stdout_start = header_end + 1
+        stderr_start = stdout_start + stdout_len
+        pos = stderr_start + stderr_len
+        if pos > len(output):
+            return None
+        results.append((status == 0, decode_output(output[stdout_start:stderr_start]),
+                        decode_output(output[stderr_start:pos])))
+    return results
+
 def compare_outputs(actual: str, expected: str) -> Tuple[bool, str]:
     """
     Compare actual output with expected output.
@@ -73,13 +142,21 @@ def compare_outputs(actual: str, expected: str) -> Tuple[bool, str]:
     
     return (False, ''.join(diff))
 
-def run_single_test(blcc_path: str, blcpp_file: Path, cpp_file: Path) -> Tuple[bool, str]:
+def run_single_test(
+    blcc_path: str,
+    blcpp_file: Path,
+    cpp_file: Path,
+    blcc_result: Optional[Tuple[bool, str, str]] = None
+) -> Tuple[bool, str]:
     """
     Run a single test case.
+    blcc_result: blcc's (success, stdout, stderr) for blcpp_file, if already run
     Returns: (passed, message)
     """
     # Run blcc compiler
-    success, stdout, stderr = run_blcc(blcc_path, blcpp_file)
+    if blcc_result is None:
+        blcc_result = run_blcc(blcc_path, blcpp_file)
+    success, stdout, stderr = blcc_result
     
     if not success:
         return (False, f"Compilation failed:\n{stderr}")
@@ -99,6 +176,22 @@ def run_single_test(blcc_path: str, blcpp_file: Path, cpp_file: Path) -> Tuple[b
     else:
         return (False, f"Output mismatch:\n{diff}")
 
+def run_test_batch(blcc_path: str, test_pairs: List[Tuple[Path, Path]]) -> List[Tuple[bool, str]]:
+    """
+    Run several test cases with one blcc process, falling back to one
+    process per test if batch mode fails.
+    Returns: (passed, message) per test pair
+    """
+    blcc_results = run_blcc_batch(blcc_path, [blcpp_file for blcpp_file, _ in test_pairs])
+    if blcc_results is None:
+        print(f"{Colors.YELLOW}Warning: blcc --batch failed, running {len(test_pairs)} tests "
+              f"one process each{Colors.RESET}", file=sys.stderr)
+        blcc_results = [None] * len(test_pairs)
+    return [
+        run_single_test(blcc_path, blcpp_file, cpp_file, blcc_result)
+        for (blcpp_file, cpp_file), blcc_result in zip(test_pairs, blcc_results)
+    ]
+
 def main():
     # Parse command line arguments
     # Default to blcc.py in the parent folder
@@ -139,19 +232,28 @@ def main():
     failed = 0
     failed_tests = []
     
-    for blcpp_file, cpp_file in test_pairs:
-        test_name = str(blcpp_file.relative_to(test_dir))
-        print(f"Testing {test_name}...", end=" ")
-        
-        success, message = run_single_test(blcc_path, blcpp_file, cpp_file)
-        
-        if success:
-            print(f"{Colors.GREEN}PASS{Colors.RESET}")
-            passed += 1
-        else:
-            print(f"{Colors.RED}FAIL{Colors.RESET}")
-            failed += 1
-            failed_tests.append((test_name, message))
+    # Split the tests into one consecutive batch per worker; each batch is a
+    # single blcc process, so interpreter and libclang startup are paid once
+    # per batch. map() hands the results back in test order, keeping the
+    # report deterministic
+    workers = min(os.cpu_count() or 1, len(test_pairs))
+    batch_size = -(-len(test_pairs) // workers)
+    batches = [test_pairs[i:i + batch_size] for i in range(0, len(test_pairs), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = chain.from_iterable(
+            executor.map(lambda batch: run_test_batch(blcc_path, batch), batches)
+        )
+        for (blcpp_file, cpp_file), (success, message) in zip(test_pairs, results):
+            test_name = str(blcpp_file.relative_to(test_dir))
+            print(f"Testing {test_name}...", end=" ")
+            
+            if success:
+                print(f"{Colors.GREEN}PASS{Colors.RESET}")
+                passed += 1
+            else:
+                print(f"{Colors.RED}FAIL{Colors.RESET}")
+                failed += 1
+                failed_tests.append((test_name, message))
     
     # Print summary
     print(f"\n{Colors.BOLD}{'='*60}{Colors.RESET}")